@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+""" Micro-benchmark of the fast BibTeX path against bibtexparser.
+
+    Parses entries shaped like JSTOR's and Oxford's citation exports with both
+    parsers, checks they agree and reports microseconds per entry.
+
+        $ python benchmarks/bench_bibtex.py --number 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from requests_raven.bibtex import parse, parse_fast, parse_bibtexparser, Unsupported
+
+
+SAMPLES = {
+    'jstor': """@article{10.1086/682574,
+    ISSN = {00223808, 1537534X},
+    URL = {http://www.jstor.org/stable/10.1086/682574},
+    abstract = {We study the determinants of inequality in a model with incomplete markets,
+    heterogeneous agents and aggregate risk. JEL Codes: E21, E32.},
+    author = {Per Krusell, Anthony A. Smith, Jr.},
+    journal = {Journal of Political Economy},
+    number = {4},
+    pages = {725-770},
+    publisher = {University of Chicago Press},
+    title = {Is Piketty's {"Second Law of Capitalism"} Fundamental?},
+    volume = {123},
+    year = {2015}
+}
+""",
+    'oxford': """@article{Acemoglu01112015,
+author = {Acemoglu, Daron and Robinson, James A.},
+title = {The Rise and Decline of General Laws of Capitalism},
+volume = {29},
+number = {1},
+pages = {3-28},
+year = {2015},
+doi = {10.1093/qje/qjv022},
+abstract = {Thomas Piketty's recent book argues that capitalism has a tendency toward
+    rising inequality. JEL Codes: E02, O10.},
+URL = {http://qje.oxfordjournals.org/content/29/1/3.abstract},
+eprint = {http://qje.oxfordjournals.org/content/29/1/3.full.pdf+html},
+journal = {The Quarterly Journal of Economics}
+}
+""",
+    'latex': """@article{10.1086/1,
+    author = {J{\\"o}rg M{\\"u}ller},
+    title = {Prices in {\\"O}sterreich},
+    year = {2015}
+}
+""",
+}
+
+
+def per_call(func, text, number):
+    """ Microseconds per call of func(text), best of three runs. """
+    return round(1e6 * min(timeit.repeat(lambda: func(text), number=number, repeat=3)) / number, 2)
+
+
+def path(text):
+    """ Which parser parse uses for text. """
+    try:
+        parse_fast(text)
+        return 'fast'
+    except Unsupported:
+        return 'bibtexparser'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=1000, help='parses per timing run')
+    parser.add_argument('--json', action='store_true', help='print one JSON document instead of a table')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, text in SAMPLES.items():
+        reference = parse_bibtexparser(text)
+        results.append({
+            'sample': name,
+            'agrees': parse(text) == reference,
+            'path': path(text),
+            'parse_us': per_call(parse, text, args.number),
+            'bibtexparser_us': per_call(parse_bibtexparser, text, args.number),
+        })
+        results[-1]['speedup'] = round(results[-1]['bibtexparser_us'] / results[-1]['parse_us'], 1)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print('{sample:7} {path:12} parse {parse_us:9.2f} us   bibtexparser {bibtexparser_us:9.2f} us   '
+              'x{speedup:<6} agrees={agrees}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+""" Cold-import time of requests_raven.
+
+    Runs each statement in a fresh interpreter several times and reports the median
+    time over a bare interpreter start, and which heavy dependencies it loaded.
+
+        $ python benchmarks/bench_import.py --repeat 20
+        $ python benchmarks/bench_import.py --json > import.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = [
+    'import requests_raven',
+    'from requests_raven import Raven',
+    'from requests_raven import Wiley',
+    'from requests_raven import EBSCOhost',
+    'from requests_raven import JSTOR',
+    'from requests_raven import OxfordQJE',
+    'from requests_raven.cli import main',
+    'from requests_raven import *',
+]
+
+HEAVY = ('requests', 'bs4', 'lxml', 'bibtexparser', 'xmltodict', 'asyncio')
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def cold(statement):
+    """ Seconds statement takes in a fresh interpreter, and the heavy modules it loaded. """
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='')
+    output = subprocess.check_output(
+        [sys.executable, '-c', PROBE.format(statement=statement, heavy=HEAVY)], env=env, cwd=ROOT
+    )
+    seconds, loaded = output.decode().split(' ', 1)
+    return float(seconds), loaded.strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='fresh interpreters per statement')
+    parser.add_argument('--json', action='store_true', help='print one JSON document instead of a table')
+    args = parser.parse_args(argv)
+
+    results = []
+    for statement in STATEMENTS:
+        runs = [cold(statement) for n in range(args.repeat)]
+        results.append({
+            'statement': statement,
+            'median_ms': round(1000 * statistics.median(seconds for seconds, loaded in runs), 2),
+            'min_ms': round(1000 * min(seconds for seconds, loaded in runs), 2),
+            'loaded': runs[-1][1].split(',') if runs[-1][1] else []
+        })
+
+    if args.json:
+        print(json.dumps({'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}, indent=2))
+        return
+    for result in results:
+        print('{median_ms:8.2f} ms  (min {min_ms:7.2f})  {statement:40}  {loaded}'.format(
+            **dict(result, loaded=' '.join(result['loaded']) or '-')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+""" Offline benchmark of the provider classes against local stub servers.
+
+    For each provider, reports the handshake time, per-document latency percentiles
+    of html, pdf and ref, ref and pdf throughput at several worker counts, and peak
+    Python memory while downloading PDFs.
+
+        $ python benchmarks/bench_providers.py --latency 0.02 --docs 50 --workers 1 4 16
+        $ python benchmarks/bench_providers.py --json > bench.json
+
+    With --baseline, the results are compared with an earlier --json report run with
+    the same settings, and the exit status is 1 if any figure is more than tolerance
+    (a fraction) worse: slower latency or handshake, lower throughput or more memory.
+
+        $ python benchmarks/bench_providers.py --baseline benchmarks/baseline.json
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from requests_raven import RavenAuth, Transport, JSTOR, Wiley, EBSCOhost, OxfordQJE
+from stubs import StubServer
+
+
+PROVIDERS = {
+    'JSTOR': (JSTOR, lambda n: '10.1086/{}'.format(682574 + n)),
+    'Wiley': (Wiley, lambda n: '10.3982/ECTA{}'.format(11000 + n)),
+    'EBSCOhost': (EBSCOhost, lambda n: str(100000 + n)),
+    'OxfordQJE': (OxfordQJE, lambda n: '10.1093/qje/qjv022'),
+}
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """ Nearest-rank percentiles of samples, in milliseconds. """
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        'p{}'.format(p): round(1000 * samples[min(len(samples) - 1, int(len(samples) * p / 100.0))], 2)
+        for p in points
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_provider(name, cls, make_id, args, directory):
+    transport = Transport(pool_maxsize=max(args.workers), retries=0)
+    login = {'userid': 'bench', 'pwd': 'bench'}
+    report = {'provider': name}
+
+    parse_pool = ProcessPoolExecutor(args.parse_processes) if args.parse_processes else None
+    start = time.perf_counter()
+    conn = cls(login=login, transport=transport, parse_pool=parse_pool)
+    report['handshake_ms'] = round(1000 * (time.perf_counter() - start), 2)
+
+    # Sequential latency per method.
+    ids = [make_id(n) for n in range(args.docs)]
+    report['latency_ms'] = {
+        'html': percentiles([timed(conn.html, id) for id in ids]),
+        'ref': percentiles([timed(conn.ref, id) for id in ids]),
+        'pdf': percentiles([timed(conn.pdf, id) for id in ids]),
+    }
+
+    # Throughput against worker count.
+    report['throughput_docs_per_s'] = {}
+    for method in ('ref', 'pdf'):
+        report['throughput_docs_per_s'][method] = {}
+        for workers in args.workers:
+            many = getattr(conn, method + '_many')
+            start = time.perf_counter()
+            errors = sum(1 for result in many(iter(ids), workers=workers) if result.error)
+            elapsed = time.perf_counter() - start
+            report['throughput_docs_per_s'][method][workers] = round(len(ids) / elapsed, 2)
+            if errors:
+                report.setdefault('errors', {})[method] = errors
+
+    # Peak memory while streaming PDFs to disk versus holding them in memory.
+    report['peak_memory_kb'] = {}
+    for mode, kwargs in (('bytes', {}), ('stream', {'stream': True})):
+        tracemalloc.start()
+        for n, id in enumerate(ids[:max(1, args.docs // 5)]):
+            conn.pdf(id, file=os.path.join(directory, '{}-{}-{}.pdf'.format(name, mode, n)), **kwargs)
+        report['peak_memory_kb'][mode] = round(tracemalloc.get_traced_memory()[1] / 1024.0, 1)
+        tracemalloc.stop()
+
+    if parse_pool is not None:
+        parse_pool.shutdown()
+    return report
+
+
+def regressions(results, baseline, tolerance):
+    """ Figures in results more than tolerance worse than the same ones in baseline,
+        as (provider, figure, baseline value, value) tuples. """
+    def figures(report):
+        # (name, value, higher is better) for every figure of a provider's report.
+        yield 'handshake_ms', report['handshake_ms'], False
+        for method, stats in report['latency_ms'].items():
+            for point, value in stats.items():
+                yield 'latency_ms.{}.{}'.format(method, point), value, False
+        for method, stats in report['throughput_docs_per_s'].items():
+            for workers, value in stats.items():
+                yield 'throughput_docs_per_s.{}.{}'.format(method, workers), value, True
+        for mode, value in report['peak_memory_kb'].items():
+            yield 'peak_memory_kb.{}'.format(mode), value, False
+
+    before = {
+        (report['provider'], name): value
+        for report in baseline['results'] for name, value, higher in figures(report)
+    }
+    found = []
+    for report in results:
+        if report.get('errors'):
+            found.append((report['provider'], 'errors', 0, report['errors']))
+        for name, value, higher in figures(report):
+            old = before.get((report['provider'], name))
+            if old is None:
+                continue
+            worse = value < old * (1 - tolerance) if higher else value > old * (1 + tolerance)
+            if worse:
+                found.append((report['provider'], name, old, value))
+    return found
+
+
+def print_report(report):
+    print('{provider}: handshake {handshake_ms} ms'.format(**report))
+    for method, stats in report['latency_ms'].items():
+        print('  {:5} latency  {}'.format(method, '  '.join('{}={}ms'.format(k, v) for k, v in stats.items())))
+    for method, stats in report['throughput_docs_per_s'].items():
+        print('  {:5} docs/s   {}'.format(method, '  '.join('{}w={}'.format(k, v) for k, v in stats.items())))
+    print('  peak memory  {}'.format('  '.join('{}={}KB'.format(k, v) for k, v in report['peak_memory_kb'].items())))
+    if 'errors' in report:
+        print('  errors       {}'.format(report['errors']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds added to every stub response')
+    parser.add_argument('--pdf-size', type=int, default=1 << 20, help='bytes per PDF')
+    parser.add_argument('--page-size', type=int, default=50000, help='bytes per HTML page')
+    parser.add_argument('--docs', type=int, default=20, help='documents per measurement')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help='worker counts to compare')
+    parser.add_argument('--parse-processes', type=int, default=0, help='parse on a pool of this many processes')
+    parser.add_argument('--providers', nargs='+', default=list(PROVIDERS), choices=list(PROVIDERS))
+    parser.add_argument('--json', action='store_true', help='print one JSON document instead of a table')
+    parser.add_argument('--baseline', help='--json report to compare with; its settings are used')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='fraction by which a figure may be worse than the baseline (default: 0.5)')
+    args = parser.parse_args(argv)
+
+    # Measure under the baseline's settings, or the comparison means nothing.
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        for name in ('latency', 'pdf_size', 'page_size', 'docs', 'workers', 'parse_processes'):
+            setattr(args, name, baseline['settings'][name])
+
+    stub = StubServer(latency=args.latency, pdf_size=args.pdf_size, page_size=args.page_size).start()
+    stub.patch(RavenAuth)
+    reports = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for name in args.providers:
+                cls, make_id = PROVIDERS[name]
+                reports.append(bench_provider(name, cls, make_id, args, directory))
+                if not args.json:
+                    print_report(reports[-1])
+    finally:
+        stub.stop()
+
+    if args.json:
+        settings = {k: v for k, v in vars(args).items() if k not in ('baseline', 'tolerance')}
+        print(json.dumps({'settings': settings, 'results': reports}, indent=2))
+    if baseline is not None:
+        # JSON keys are strings, so compare reports as read back from JSON.
+        found = regressions(json.loads(json.dumps(reports)), baseline, args.tolerance)
+        for provider, name, old, value in found:
+            print('REGRESSION {} {}: {} -> {}'.format(provider, name, old, value), file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
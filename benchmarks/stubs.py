@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+""" Local stand-ins for Raven, ezproxy and the publishers, for offline benchmarks.
+
+    One threaded HTTP server plays every part. Point RavenAuth at it with
+    StubServer.patch(); after the SAML exchange every provider's destination URL is
+    the stub itself, which then answers JSTOR, Wiley, EBSCOhost and Oxford paths.
+    latency (seconds) is added to every response and pdf_size sets the PDF payload.
+    Setting throttle to n answers the next n publisher requests with 429, and paths
+    starting with any prefix in broken get an HTML error page. With etags set, GET
+    responses carry an ETag of their body and a matching If-None-Match gets a 304.
+    PDFs honour 'Range: bytes=n-' with a 206, or a 416 if n is past the end.
+    Setting expire_after to n ends the ezproxy session after n more publisher
+    requests: later ones are redirected to the ezproxy login page until the
+    handshake is run again.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+from html import escape
+import hashlib
+import re
+import threading
+import time
+
+
+BIBTEX = """@article{{{doi},
+    author = {{Per Krusell and Anthony A. Smith and Jane Doe}},
+    title = {{Article {doi}}},
+    journal = {{Quarterly Journal of Economics}},
+    volume = {{130}},
+    number = {{4}},
+    pages = {{1623-1672}},
+    year = {{2015}},
+    issn = {{00335533, 15314650}},
+    doi = {{{doi}}},
+    abstract = {{An abstract. JEL Codes: E21, E32.}}
+}}
+"""
+
+RIS = """TY  - JOUR
+AU  - Krusell, Per
+AU  - Smith, Anthony A.
+TI  - Article {doi}
+JO  - Econometrica
+VL  - 83
+IS  - 4
+SP  - 1623
+EP  - 1672
+PY  - 2015
+DO  - {doi}
+SN  - 1468-0262
+AB  - An abstract.
+ER  -
+"""
+
+EBSCO_REC = """<rec><header uiTerm="{an}" shortDbName="bth" longDbName="Business Source">
+<controlInfo><jinfo><jtl>Journal</jtl><issn>00000000</issn></jinfo>
+<pubinfo><dt year="2015" month="11"/><vid>130</vid><iid>4</iid></pubinfo>
+<artinfo><ui type="doi">10.1086/{an}</ui><ppf>1623</ppf><ppct>50</ppct><tig><atl>Article {an}</atl></tig>
+<sug><subj type="thes">Economics</subj><subj type="thes">Health</subj></sug>
+<ab>An abstract.</ab><pubtype>Academic Journal</pubtype><doctype>Article</doctype>
+<aug><au>Krusell, Per</au><au>Smith, Anthony A.</au><affil>Stockholm</affil><affil>Yale</affil></aug>
+</artinfo></controlInfo><displayInfo><pLink><url>http://example.org/{an}</url></pLink></displayInfo>
+</header></rec>"""
+
+# Exported records for ANs starting 'bare': no optional elements; 'empty': no header at all.
+EBSCO_BARE = '<rec><header uiTerm="{an}" shortDbName="bth" longDbName="Business Source"><controlInfo/></header></rec>'
+EBSCO_EMPTY = '<rec><header/></rec>'
+
+ABSTRACT_PAGE = """<html><head><title>Article</title>
+<meta name="citation_author" content="Krusell, Per"><meta name="citation_author_institution" content="Stockholm University">
+<meta name="citation_author" content="Smith, Anthony A."><meta name="citation_author_institution" content="Yale University">
+</head><body>{filler}
+<div class="authorInfo"><p>Per Krusell</p>Stockholm University<p>Anthony A. Smith</p>Yale University</div>
+<ol class="affiliation-list"><li><address>Stockholm University</address></li><li><address>Yale University</address></li></ol>
+</body></html>"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def send(self, body, content_type='text/html; charset=utf-8', status=200, headers=()):
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        time.sleep(self.stub.latency)
+        if self.stub.etags and self.command == 'GET' and status == 200:
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+            headers = list(headers) + [('ETag', etag)]
+            if self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range') or '')
+        if match and status == 200 and content_type == 'application/pdf':
+            start, size = int(match.group(1)), len(body)
+            if start >= size:
+                status, body, content_type = 416, b'Range not satisfiable', 'text/html; charset=utf-8'
+                headers = list(headers) + [('Content-Range', 'bytes */{}'.format(size))]
+            else:
+                status, body = 206, body[start:]
+                headers = list(headers) + [('Content-Range', 'bytes {}-{}/{}'.format(start, size - 1, size))]
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, headers=()):
+        time.sleep(self.stub.latency)
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def route(self, method):
+        url = urlparse(self.path)
+        path = re.sub('/+', '/', url.path)
+        query = parse_qs(url.query)
+        self.stub.count(path)
+        body = b''
+        if method == 'POST':
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        form = parse_qs(body.decode('utf8'))
+        base = self.stub.url
+
+        # Raven and ezproxy.
+        if path == '/raven/login':
+            return self.send('Logged in', headers=[('Set-Cookie', 'raven=1; Path=/')])
+        if path == '/ezproxy/login':
+            return self.send(
+                '<form name="EZproxyForm" action="{}/idp/saml"><input name="SAMLRequest" value="req">'
+                '<input name="RelayState" value="{}"></form>'.format(base, escape(query['url'][0])))
+        if path == '/idp/saml':
+            return self.send(
+                '<form action="{}/ezproxy/acs"><input name="SAMLResponse" value="resp">'
+                '<input name="RelayState" value="{}"></form>'.format(base, escape(form['RelayState'][0])))
+        if path == '/ezproxy/acs':
+            target = urlparse(form['RelayState'][0]).path or '/'
+            cookie = 'ezproxy=live{}; Path=/'.format(self.stub.session)
+            return self.redirect(base + target, headers=[('Set-Cookie', cookie)])
+
+        # ezproxy sending requests without a live session back to its login page.
+        if not self.stub.live(self.headers.get('Cookie')):
+            return self.redirect('{}/ezproxy/login?url={}'.format(base, quote(base + self.path, safe='')))
+
+        # Publishers throttling.
+        if self.stub.throttled():
+            return self.send('Too many requests', status=429)
+        if path.startswith(tuple(self.stub.broken)):
+            return self.send('<html><body>An error has occurred.</body></html>')
+
+        # JSTOR.
+        if path.startswith('/stable/info/'):
+            return self.send(self.stub.page())
+        if path.startswith('/stable/pdfplus/'):
+            if 'tc=1' not in (self.headers.get('Cookie') or ''):
+                return self.send('<html>Terms and conditions</html>', headers=[('Set-Cookie', 'tc=1; Path=/')])
+            return self.send(self.stub.pdf, 'application/pdf')
+        if path.startswith('/citation/text/'):
+            return self.send(BIBTEX.format(doi=path[len('/citation/text/'):]), 'text/plain; charset=utf-8')
+
+        # Wiley.
+        if path.startswith('/doi/') and path.endswith('/abstract'):
+            return self.send(self.stub.page())
+        if path.startswith('/doi/') and path.endswith('/pdf'):
+            return self.send('<iframe id="pdfDocument" src="{}/pdfdirect"></iframe>'.format(base))
+        if path == '/documentcitationdownloadformsubmit':
+            return self.send(''.join(RIS.format(doi=doi) for doi in form.get('doi', [])), 'text/plain; charset=utf-8')
+        if path == '/pdfdirect':
+            return self.send(self.stub.pdf, 'application/pdf')
+
+        # EBSCOhost.
+        if path == '/login.aspx':
+            return self.redirect('{}/ehost/detail/detail?sid=s1&vid=1&hid=h1&bdata=b1'.format(base))
+        if path == '/ehost/detail/detail':
+            return self.send(self.stub.page())
+        if path == '/ehost/pdfviewer/pdfviewer':
+            return self.send('<input name="pdfUrl" value="{}/pdfdirect">'.format(base))
+        if path.startswith('/ehost/delivery/ExportPanelSave/'):
+            ans = [item.split('__')[1] for item in path.rsplit('/', 1)[1].split(',')]
+            recs = [EBSCO_BARE if an.startswith('bare') else EBSCO_EMPTY if an.startswith('empty') else EBSCO_REC for an in ans]
+            return self.send('<records>' + ''.join(rec.format(an=an) for rec, an in zip(recs, ans)) + '</records>', 'text/xml')
+
+        # Oxford.
+        if path == '/search':
+            return self.send(
+                '<div class="cit-extra"><a rel="abstract" href="{0}/content/130/4/1623.abstract">Abstract</a>'
+                '<a rel="full-text.pdf" href="{0}/content/130/4/1623.full.pdf+html">PDF</a></div>'
+                '<input name="gca" value="qje;130/4/1623">'.format(base))
+        if path == '/citmgr':
+            return self.send(BIBTEX.format(doi='10.1093/qje/qjv022'), 'text/plain; charset=utf-8')
+        if path.endswith('.abstract'):
+            return self.send(self.stub.page())
+        if path.endswith('.full.pdf'):
+            return self.send(self.stub.pdf, 'application/pdf')
+
+        return self.send('Not found', status=404)
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+
+class Server(ThreadingHTTPServer):
+    # Room for many workers connecting at once.
+    request_queue_size = 256
+
+
+class StubServer(object):
+    """ Threaded stand-in for Raven, ezproxy and all four publishers. """
+    def __init__(self, latency=0.0, pdf_size=1 << 20, page_size=50000, port=0):
+        self.latency = latency
+        self.pdf = b'%PDF-1.4\n' + b'0' * max(0, pdf_size - 9)
+        self.page_size = page_size
+        self.requests = {}
+        self.throttle = 0
+        self.broken = set()
+        self.etags = False
+        self.expire_after = None
+        self.session = 1
+        self._lock = threading.Lock()
+        self.server = Server(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def live(self, cookie):
+        """ Whether a publisher request with cookie header cookie has a live session. """
+        with self._lock:
+            if self.expire_after is not None:
+                self.expire_after -= 1
+                if self.expire_after < 0:
+                    self.session += 1
+                    self.expire_after = None
+            return 'ezproxy=live{}'.format(self.session) in (cookie or '').split('; ')
+
+    def throttled(self):
+        with self._lock:
+            if self.throttle > 0:
+                self.throttle -= 1
+                return True
+            return False
+
+    def page(self):
+        return ABSTRACT_PAGE.format(filler='<p>lorem ipsum</p>' * (self.page_size // 18))
+
+    def patch(self, auth_class):
+        """ Point a RavenAuth class at this server. """
+        auth_class.raven_login = self.url + '/raven/login'
+        auth_class.ezproxy = self.url + '/ezproxy/login'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -31,8 +31,54 @@ __license__ = 'Apache 2.0'
 __copyright__ = 'Copyright 2015 Erin Hengel'
 
 
-from .raven import Raven
-from .jstor import JSTOR
-from .ebscohost import EBSCOhost
-from .wiley import Wiley
-from .oxford_qje import OxfordQJE
+from importlib import import_module
+
+from .exceptions import RavenError, NotPDFError, SessionExpiredError, AlreadyFetched, CircuitOpenError
+
+
+# Everything else is imported on first access, so `import requests_raven` does not pull in
+# Requests, BeautifulSoup or bibtexparser until a script actually needs them.
+_LAZY = {
+    'Raven': 'raven',
+    'RavenAuth': 'auth',
+    'SessionStore': 'store',
+    'ResponseCache': 'cache',
+    'Catalogue': 'catalogue',
+    'Transport': 'transport',
+    'Scheduler': 'schedule',
+    'Metrics': 'metrics',
+    'Hedge': 'resilience',
+    'CircuitBreaker': 'resilience',
+    'Result': 'batch',
+    'SessionPool': 'pool',
+    'Download': 'download',
+    'Outcome': 'download',
+    'Record': 'records',
+    'Author': 'records',
+    'JSONLWriter': 'records',
+    'SQLiteWriter': 'records',
+    'JSTOR': 'jstor',
+    'EBSCOhost': 'ebscohost',
+    'Wiley': 'wiley',
+    'OxfordQJE': 'oxford_qje',
+    'AsyncRaven': 'aio',
+    'AsyncJSTOR': 'aio',
+    'AsyncEBSCOhost': 'aio',
+    'AsyncWiley': 'aio',
+    'AsyncOxfordQJE': 'aio',
+}
+
+__all__ = ['RavenError', 'NotPDFError', 'SessionExpiredError', 'AlreadyFetched', 'CircuitOpenError'] + list(_LAZY)
+
+
+def __getattr__(name):
+    # PEP 562: called only for names not yet in the module namespace.
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(import_module('.' + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
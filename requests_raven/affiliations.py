@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+""" Matching authors to affiliations found on a publisher's page.
+
+    Names are normalised once into (surname, given names, initials) keys and a page's
+    (name, affiliation) pairs go into one dictionary per key type, so resolving every
+    author of a paper is one pass over the authors with constant-time lookups.
+"""
+
+import re
+import unicodedata
+
+
+PUNCTUATION = re.compile(r"[^\w\s'-]", re.UNICODE)
+SEPARATORS = re.compile(r'[\s-]+', re.UNICODE)
+
+
+def fold(text):
+    """ Lower case, accents, full stops and extra whitespace removed. """
+    text = unicodedata.normalize('NFKD', text.replace(u'\xa0', u' '))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(PUNCTUATION.sub(' ', text.casefold()).split())
+
+
+def split_name(name):
+    """ (surname, given names, initials) of "Surname, Given" or "Given Surname", folded. """
+    if ',' in name:
+        surname, given = name.split(',', 1)
+    else:
+        parts = name.split()
+        surname, given = (parts[-1], ' '.join(parts[:-1])) if parts else ('', '')
+    surname, given = fold(surname), fold(given)
+    initials = ''.join(part[0] for part in SEPARATORS.split(given) if part)
+    return surname, given, initials
+
+
+def compatible(initials, other):
+    """ True unless both sets of initials are known and neither starts the other. """
+    return not initials or not other or initials.startswith(other) or other.startswith(initials)
+
+
+class AffiliationIndex(object):
+    """ Affiliations on one page keyed by author name.
+        lookup tries the full name, then surname and initials; within each, the first
+        author listed on the page wins, and if that author has no affiliation the next
+        key is tried. If loose, the surname alone is tried last, but only when exactly
+        one author on the page has that surname and initials that don't contradict
+        the name's, so a co-author is never given someone else's affiliation.
+
+            >>> index = AffiliationIndex([('Krusell, Per', 'Stockholm University')])
+            >>> index.resolve(['Per Krusell', 'P. Krusell', 'Jane Doe'])
+            ['Stockholm University', 'Stockholm University', None]
+    """
+    def __init__(self, pairs=()):
+        self.keys = ({}, {})
+        self.surnames = {}
+        for name, affiliation in pairs:
+            self.add(name, affiliation)
+
+    @staticmethod
+    def _keys(name):
+        surname, given, initials = split_name(name)
+        return (
+            (surname, given) if surname and given else None,
+            (surname, initials) if surname and initials else None
+        )
+
+    def add(self, name, affiliation):
+        """ Index affiliation under every key of name; earlier entries are kept. """
+        for table, key in zip(self.keys, self._keys(name)):
+            if key is not None:
+                table.setdefault(key, affiliation)
+        surname, given, initials = split_name(name)
+        if surname:
+            self.surnames.setdefault(surname, []).append((initials, affiliation))
+
+    def lookup(self, name, loose=True):
+        """ Affiliation of name, or None. """
+        for table, key in zip(self.keys, self._keys(name)):
+            affiliation = table.get(key)
+            if affiliation:
+                return affiliation
+        if loose:
+            surname, given, initials = split_name(name)
+            matches = [found for other, found in self.surnames.get(surname, ()) if compatible(initials, other)]
+            if len(matches) == 1:
+                return matches[0]
+
+    def resolve(self, names, loose=True):
+        """ Affiliation of each of names, None where not found. """
+        return [self.lookup(name, loose) for name in names]
+
+
+def meta_pairs(soup):
+    """ (author, institution) of each citation_author meta tag; the institution is
+        the citation_author_institution tag straight after it, if any. """
+    for tag in soup.find_all('meta', attrs={'name': 'citation_author'}):
+        following = tag.find_next('meta')
+        institution = None
+        if following is not None and following.get('name') == 'citation_author_institution':
+            institution = following.get('content')
+        yield tag.get('content', ''), institution
+
+
+def within(name, pairs):
+    """ Affiliation following the first text that contains name, e.g. a name printed
+        inside a longer line; None if no text does. """
+    folded = fold(name)
+    if folded:
+        for text, affiliation in pairs:
+            if folded in fold(text):
+                return affiliation
+
+
+def text_pairs(element):
+    """ (text, following text) of each piece of text under element, for pages that
+        print each author's name with the affiliation straight after it. """
+    for string in element.find_all(string=True):
+        text = string.strip()
+        if text:
+            following = string.next_element
+            affiliation = following.string if following is not None else None
+            yield text, affiliation.strip() if affiliation else None
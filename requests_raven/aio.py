@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+from .batch import Result
+from .raven import Raven
+from .jstor import JSTOR
+from .ebscohost import EBSCOhost
+from .wiley import Wiley
+from .oxford_qje import OxfordQJE
+
+
+class AsyncRaven(object):
+    """ Asyncio counterpart of Raven.
+        Every method of the wrapped connection object becomes a coroutine run on a
+        bounded thread pool sharing the authenticated session, so the event loop can
+        keep up to limit requests in flight. Each call in flight holds one thread:
+        concurrency is bounded by the pool's size, not by the event loop. A pool
+        created here grows to the largest limit passed to map; a supplied executor
+        is used as it is.
+
+            >>> conn = await AsyncJSTOR.create(login=deets, limit=16)
+            >>> pdf = await conn.pdf(id=doc_id)
+            >>> async for result in conn.map('ref', doc_ids, affiliation=True):
+            ...     print(result.id, result.value)
+    """
+    provider = Raven
+
+    def __init__(self, conn, limit=8, executor=None):
+        self.conn = conn
+        self.limit = limit
+        self.threads = None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=limit)
+            self.threads = limit
+        self.executor = executor
+
+    @classmethod
+    async def create(cls, *args, limit=8, executor=None, **kwargs):
+        """ Establish the Raven connection without blocking the event loop. """
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(executor, partial(cls.provider, *args, **kwargs))
+        return cls(conn, limit=limit, executor=executor)
+
+    def reserve(self, limit):
+        """ Make sure a pool created here has a thread for each of limit calls in flight.
+            A larger pool replaces it; calls already running finish on the old one. """
+        if self.threads is not None and limit > self.threads:
+            old, self.executor = self.executor, ThreadPoolExecutor(max_workers=limit)
+            self.threads = limit
+            old.shutdown(wait=False)
+
+    @property
+    def session(self):
+        return self.conn.session
+
+    @property
+    def url(self):
+        return self.conn.url
+
+    def __getattr__(self, name):
+        method = getattr(self.conn, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(method, *args, **kwargs))
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    async def map(self, method, ids, limit=None, **kwargs):
+        """ Call method for every id with at most limit calls in flight.
+            Yields a Result per id in completion order; errors are attached, not raised.
+            ids may be any iterable and is consumed lazily. """
+        limit = limit or self.limit
+        self.reserve(limit)
+        call = getattr(self, method)
+
+        async def run(id):
+            try:
+                return Result(id, await call(id, **kwargs), None)
+            except Exception as error:
+                return Result(id, None, error)
+
+        pending = set()
+        for id in ids:
+            if len(pending) >= limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.ensure_future(run(id)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    def close(self):
+        """ Shut down the thread pool. """
+        self.executor.shutdown(wait=False)
+
+
+class AsyncJSTOR(AsyncRaven):
+    """ Asyncio counterpart of JSTOR. """
+    provider = JSTOR
+
+
+class AsyncEBSCOhost(AsyncRaven):
+    """ Asyncio counterpart of EBSCOhost. """
+    provider = EBSCOhost
+
+
+class AsyncWiley(AsyncRaven):
+    """ Asyncio counterpart of Wiley. """
+    provider = Wiley
+
+
+class AsyncOxfordQJE(AsyncRaven):
+    """ Asyncio counterpart of OxfordQJE. """
+    provider = OxfordQJE
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+import sys
+import threading
+import time
+import traceback
+import getpass
+
+from .parsing import make_soup, SAML_REQUEST, SAML_RESPONSE
+from .transport import Transport
+
+
+# Hosts that only ever serve login pages; a redirect to one means the session is dead.
+LOGIN_HOSTS = ('raven.cam.ac.uk', 'ezproxy.lib.cam.ac.uk')
+
+
+def is_login_url(url):
+    """ True if url points at the Raven or ezproxy login pages, including the ones
+        RavenAuth is configured with. """
+    parts = urlparse(url)
+    page = '{}://{}{}'.format(parts.scheme, parts.netloc, parts.path)
+    return parts.hostname in LOGIN_HOSTS or page in (RavenAuth.raven_login, RavenAuth.ezproxy)
+
+
+class RavenAuth(object):
+    """ Authentication context shared by Raven connection objects.
+        Logs onto Raven at most once and runs only the per-host SAML leg for each
+        destination, so every connection built from it shares one Requests Session
+        (one cookie jar and one connection pool) configured by transport.
+
+            >>> auth = RavenAuth(login=deets)
+            >>> auth.connect(['http://www.jstor.org', 'http://onlinelibrary.wiley.com'])
+            >>> jstor = JSTOR(login=deets, auth=auth)
+            >>> wiley = Wiley(login=deets, auth=auth)
+    """
+    raven_login = 'https://raven.cam.ac.uk/auth/authenticate2.html'
+    ezproxy = 'http://ezproxy.lib.cam.ac.uk:2048/login'
+
+    def __init__(self, login={}, store=None, transport=None, metrics=None):
+
+        # Ask for username if not supplied; password is only needed to log in.
+        if 'userid' not in login:
+            login['userid'] = input('CRSid (userid): ')
+
+        self.login = login
+        self.store = store
+        self.metrics = metrics
+        self.transport = transport or Transport()
+        self.session = self.transport.mount(requests.Session())
+        self.logged_in = False
+        self.destinations = {}
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    def send(self, method, url, phase, **kwargs):
+        """ Send a handshake request, timed under method auth if metrics are kept. """
+        kwargs.setdefault('timeout', self.transport.timeout)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            response = self.session.request(method, url, **kwargs)
+            wait = self.transport.throttle_wait(method, response, attempt)
+            if wait is None:
+                break
+            response.close()
+            time.sleep(wait)
+            attempt += 1
+        if self.metrics is not None:
+            self.metrics.observe('Raven', 'auth', phase, time.perf_counter() - start,
+                                 len(response.content), response.status_code)
+        return response
+
+    def destination(self, url):
+        """ Return the ezproxy URL for url, completing the SAML leg the first time. """
+        with self._lock:
+            if url in self.destinations:
+                return self.destinations[url]
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        # Different destinations proceed in parallel; the same one is only resolved once.
+        with url_lock:
+            if url not in self.destinations:
+                if self.store is None or not self.resume(url):
+                    self.handshake(url)
+                    if self.store is not None:
+                        self.store.save(self.login['userid'], url, self.destinations[url], self.session.cookies)
+            return self.destinations[url]
+
+    def connect(self, urls, workers=4):
+        """ Resolve several destinations in parallel.
+            Returns dictionary mapping each URL to its ezproxy URL. """
+        urls = list(urls)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(urls, executor.map(self.destination, urls)))
+
+    def resume(self, url):
+        """ Load a saved session and check it with a single request.
+            Returns True if the session is live. """
+        userid = self.login['userid']
+        entry = self.store.load(userid, url)
+        if entry is None:
+            return False
+        for cookie in entry['cookies']:
+            self.session.cookies.set(**cookie)
+
+        # A live session serves the destination; a dead one redirects to the login pages.
+        probe = self.send('GET', entry['url'], 'resume', allow_redirects=False)
+        location = probe.headers.get('Location', '')
+        if probe.status_code >= 400 or (probe.is_redirect and is_login_url(location)):
+            self.store.discard(userid, url)
+            return False
+
+        self.destinations[url] = entry['url']
+        return True
+
+    def reset(self):
+        """ Forget the Raven login and every destination, e.g. after ezproxy expired them.
+            The next destination call runs the full handshake again. """
+        with self._lock:
+            if self.store is not None:
+                for url in self.destinations:
+                    self.store.discard(self.login['userid'], url)
+            self.session.cookies.clear()
+            self.destinations.clear()
+            self.logged_in = False
+
+    def authenticate(self):
+        """ Log into Raven unless already logged in. """
+        with self._lock:
+            if self.logged_in:
+                return
+
+            # Ask for password if not supplied.
+            if 'pwd' not in self.login:
+                self.login['pwd'] = getpass.getpass(stream=sys.stderr, prompt='Raven password (pwd): ')
+
+            # Input value to submit form.
+            self.login['submit'] = 'Login'
+
+            # Log into Raven.
+            self.send('POST', self.raven_login, 'login', data=self.login)
+            self.logged_in = True
+
+    def handshake(self, url):
+        """ Complete the SAML handshake for url, logging into Raven first if need be. """
+        self.authenticate()
+
+        # SAML request.
+        request = self.send('GET', self.ezproxy+'?url='+url, 'saml-request')
+        soup = make_soup(request.text, SAML_REQUEST)
+        saml = {
+            'SAMLRequest': soup.find(attrs={'name': 'SAMLRequest'})['value'],
+            'RelayState': soup.find(attrs={'name': 'RelayState'})['value'],
+            'url1': soup.find(attrs={'name': 'EZproxyForm'})['action']
+        }
+
+        # SAML response.
+        response = self.send('POST', saml['url1'], 'saml-response', data=saml)
+        soup = make_soup(response.text, SAML_RESPONSE)
+        try:
+            saml['SAMLResponse'] = soup.find(attrs={'name': 'SAMLResponse'})['value']
+            saml['url2'] = soup.find('form')['action']
+        except TypeError: # Username and password probably entered incorrectly.
+            traceback.print_exc(file=sys.stdout)
+            print("You're getting this error probably because your CRSid or password are incorrect.")
+            print("If this error persists, we have a problem so say something: github.com/erinhengel/raven-request.")
+            sys.exit(1)
+
+        # Complete SAML handshake; save destination URL.
+        post = self.send('POST', saml['url2'], 'saml-complete', data=saml)
+        self.destinations[url] = post.url
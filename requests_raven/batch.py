@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Outcome of one document in a batch: the value returned or the exception raised.
+Result = namedtuple('Result', ['id', 'value', 'error'])
+
+
+def imap_unordered(func, ids, workers=4):
+    """ Call func(id) for every id on a pool of workers threads.
+        Yields a Result per id in completion order; errors are attached, not raised.
+        At most twice workers ids are read ahead, so ids may be an arbitrarily long iterator. """
+
+    def run(id):
+        try:
+            return Result(id, func(id), None)
+        except Exception as error:
+            return Result(id, None, error)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for id in ids:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(run, id))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+""" Fast parser for the single-entry BibTeX served by JSTOR and Oxford's citation exports.
+
+    Handles one @type{key, field = {value} | "value" | 123, ...} entry without LaTeX
+    escapes, and gives the same result as bibtexparser with the convert_to_unicode
+    customization. Anything else (LaTeX, @string macros, # concatenation, several
+    entries) is handed to bibtexparser, which is imported only then.
+"""
+
+import re
+import unicodedata
+
+
+ENTRY = re.compile(r'\s*@\s*(\w+)\s*\{\s*([^,\s{}]+)\s*,')
+FIELD = re.compile(r'\s*([\w\-:.]+)\s*=\s*')
+NUMBER = re.compile(r'\d+')
+SEPARATOR = re.compile(r'\s*(,?)\s*')
+CONTINUATION = re.compile(r'\n[ \t]*')
+
+
+class Unsupported(ValueError):
+    """ Text is outside the dialect parse_fast understands. """
+
+
+def _braced(text, start):
+    # Index just past the brace closing the one at start.
+    depth = 0
+    for n in range(start, len(text)):
+        char = text[n]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if not depth:
+                return n + 1
+    raise Unsupported('unbalanced braces')
+
+
+def _quoted(text, start):
+    # Index just past the quote closing the one at start; quotes inside braces don't count.
+    depth = 0
+    for n in range(start + 1, len(text)):
+        char = text[n]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif char == '"' and not depth:
+            return n + 1
+    raise Unsupported('unterminated quote')
+
+
+def _clean(value):
+    # What convert_to_unicode leaves: no braces, continuation lines unindented, NFC.
+    value = CONTINUATION.sub('\n', value.replace('{', '').replace('}', ''))
+    return unicodedata.normalize('NFC', value)
+
+
+def parse_fast(text):
+    """ Parse one BibTeX entry into a dictionary; raise Unsupported if text needs bibtexparser. """
+    if '\\' in text:
+        raise Unsupported('LaTeX escapes')
+    match = ENTRY.match(text)
+    if not match or match.group(1).lower() in ('string', 'comment', 'preamble'):
+        raise Unsupported('not a single entry')
+    entry = {'ENTRYTYPE': match.group(1).lower(), 'ID': match.group(2)}
+    pos = match.end()
+    while True:
+        closing = SEPARATOR.match(text, pos).end()
+        if text.startswith('}', closing):
+            break
+        field = FIELD.match(text, pos)
+        if not field:
+            raise Unsupported('bad field at {}'.format(pos))
+        start = field.end()
+        char = text[start:start + 1]
+        if char == '{':
+            end = _braced(text, start)
+            value = text[start + 1:end - 1]
+        elif char == '"':
+            end = _quoted(text, start)
+            value = text[start + 1:end - 1]
+        else:
+            number = NUMBER.match(text, start)
+            if not number:
+                raise Unsupported('macro or concatenation at {}'.format(start))
+            end = number.end()
+            value = number.group()
+        # bibtexparser keeps the first of repeated fields.
+        entry.setdefault(field.group(1).lower(), _clean(value))
+        separator = SEPARATOR.match(text, end)
+        pos = separator.end()
+        if not separator.group(1) and not text.startswith('}', pos):
+            raise Unsupported('missing comma at {}'.format(pos))
+    if text[closing + 1:].strip():
+        raise Unsupported('more than one entry')
+    return entry
+
+
+def parse_bibtexparser(text):
+    """ Parse text with bibtexparser and convert_to_unicode; return its list of entries. """
+    import bibtexparser
+    from bibtexparser.bparser import BibTexParser
+    from bibtexparser.customization import convert_to_unicode
+    parser = BibTexParser()
+    parser.customization = convert_to_unicode
+    return bibtexparser.loads(text, parser=parser).entries
+
+
+def parse(text):
+    """ List of entries in text: the fast path for one plain entry, bibtexparser otherwise. """
+    try:
+        return [parse_fast(text)]
+    except Unsupported:
+        return parse_bibtexparser(text)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .records import Record, jsonable
+
+
+class ResponseCache(object):
+    """ Size-bounded on-disk cache of html, pdf and ref results.
+        Entries are keyed by (provider, method, id, params). Bodies are stored once per
+        content hash, so the same PDF fetched under two keys takes the space of one.
+        When the total size of stored bodies exceeds max_size bytes, the least recently
+        used entries are evicted.
+
+        If the publisher sent an ETag or Last-Modified header with the final response,
+        a hit is revalidated with one conditional GET; a 304 returns the cached body.
+        Other entries are returned without a request until they are ttl seconds old
+        (never expire if ttl is None).
+
+        Concurrent calls for the same key wait for the first one and are then served
+        from the cache rather than all going to the publisher.
+    """
+    def __init__(self, path=None, max_size=1 << 30, ttl=None, revalidate=True):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.requests_raven', 'cache')
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.revalidate = revalidate
+        if not os.path.isdir(os.path.join(path, 'blobs')):
+            os.makedirs(os.path.join(path, 'blobs'))
+
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._db = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, digest TEXT, kind TEXT, '
+                'url TEXT, etag TEXT, last_modified TEXT, stored REAL, atime REAL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER)')
+
+    @staticmethod
+    def key(provider, method, id, params):
+        """ Cache key of a provider method call. """
+        text = json.dumps([provider, method, str(id), params], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+    def _blob(self, digest):
+        # Two-level fan-out keeps directories small.
+        return os.path.join(self.path, 'blobs', digest[:2], digest)
+
+    def get(self, key):
+        """ Return the entry stored under key as a dictionary, or None. """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest, kind, url, etag, last_modified, stored FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return
+            with self._db:
+                self._db.execute('UPDATE entries SET atime = ? WHERE key = ?', (time.time(), key))
+        return dict(zip(('digest', 'kind', 'url', 'etag', 'last_modified', 'stored'), row))
+
+    def read(self, entry):
+        """ Return the cached value of an entry. """
+        with open(self._blob(entry['digest']), 'rb') as fh:
+            body = fh.read()
+        if entry['kind'] == 'bytes':
+            return body
+        if entry['kind'] == 'text':
+            return body.decode('utf8')
+        if entry['kind'] == 'record':
+            return Record.from_dict(json.loads(body.decode('utf8')))
+        return json.loads(body.decode('utf8'))
+
+    def put(self, key, value, response=None):
+        """ Store value under key with the validators of the response it came from. """
+        if isinstance(value, bytes):
+            kind, body = 'bytes', value
+        elif isinstance(value, str):
+            kind, body = 'text', value.encode('utf8')
+        elif isinstance(value, Record):
+            kind, body = 'record', json.dumps(value, default=jsonable).encode('utf8')
+        else:
+            kind, body = 'json', json.dumps(value).encode('utf8')
+        digest = hashlib.sha256(body).hexdigest()
+
+        url = etag = last_modified = None
+        if response is not None:
+            url = response.url
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+        # Write the body once per content hash.
+        blob = self._blob(digest)
+        if not os.path.exists(blob):
+            if not os.path.isdir(os.path.dirname(blob)):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob))
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(body)
+            os.replace(tmp, blob)
+
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?)', (digest, len(body)))
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, digest, kind, url, etag, last_modified, now, now)
+            )
+        self.evict()
+
+    def refresh(self, key):
+        """ Mark an entry as freshly validated. """
+        with self._lock, self._db:
+            self._db.execute('UPDATE entries SET stored = ? WHERE key = ?', (time.time(), key))
+
+    def delete(self, key):
+        """ Remove an entry; its body goes too unless another entry shares it. """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self._collect()
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits in max_size. """
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total <= self.max_size:
+                return
+            refs = dict(self._db.execute('SELECT digest, COUNT(*) FROM entries GROUP BY digest'))
+            sizes = dict(self._db.execute('SELECT digest, size FROM blobs'))
+            with self._db:
+                for key, digest in self._db.execute('SELECT key, digest FROM entries ORDER BY atime').fetchall():
+                    self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    refs[digest] -= 1
+                    if not refs[digest]:
+                        total -= sizes.get(digest, 0)
+                    if total <= self.max_size:
+                        break
+        self._collect()
+
+    def _collect(self):
+        # Delete bodies no longer referenced by any entry.
+        with self._lock, self._db:
+            orphans = self._db.execute(
+                'SELECT digest FROM blobs WHERE digest NOT IN (SELECT digest FROM entries)'
+            ).fetchall()
+            for digest, in orphans:
+                self._db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                try:
+                    os.remove(self._blob(digest))
+                except OSError:
+                    pass
+
+    def lookup(self, key, get):
+        """ Return (True, value) on a valid hit and (False, None) otherwise.
+            get is used for the conditional request when the entry has validators. """
+        entry = self.get(key)
+        if entry is None:
+            return False, None
+
+        # Revalidate with the publisher where it supports conditional requests.
+        if self.revalidate and entry['url'] and (entry['etag'] or entry['last_modified']):
+            headers = {}
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+            response = get(entry['url'], headers=headers, stream=True)
+            response.close()
+            if response.status_code != 304:
+                return False, None
+            self.refresh(key)
+        elif self.ttl is not None and time.time() - entry['stored'] > self.ttl:
+            return False, None
+
+        try:
+            return True, self.read(entry)
+        except IOError:
+            self.delete(key)
+            return False, None
+
+
+    @contextmanager
+    def _flight(self, key):
+        # Hold key's lock, shared by every concurrent call for key, for the duration.
+        with self._lock:
+            flight = self._flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0]:
+                yield
+        finally:
+            with self._lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self._flights[key]
+
+    def call(self, conn, name, method, id, args, kwargs):
+        """ Serve conn.name(id, *args, **kwargs) from the cache, calling method on a miss.
+            Truthy results are stored with the validators of the operation's own last
+            response, not that of an operation it ran in turn (e.g. the html behind a ref).
+            A cached PDF is still written to file if one is given. """
+        file = kwargs.get('file')
+        params = {k: v for k, v in kwargs.items() if k != 'file'}
+        key = self.key(type(conn).__name__, name, id, [args, params])
+        with self._flight(key):
+            return self._call(conn, key, method, id, args, kwargs, file)
+
+    def _call(self, conn, key, method, id, args, kwargs, file):
+        hit, value = self.lookup(key, lambda url, **kw: conn.get(url, phase='revalidate', **kw))
+        if hit:
+            if file and isinstance(value, bytes):
+                with open(file, 'wb') as fh:
+                    fh.write(value)
+            return value
+
+        conn._local.responses[-1] = None
+        value = method(conn, id, *args, **kwargs)
+        if value:
+            response = conn._local.responses[-1]
+            if response is None or response.request.method != 'GET' or response.status_code != 200:
+                response = None
+            self.put(key, value, response)
+        return value
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+""" Local record of what has been fetched, for skipping documents already on disk.
+
+    Every html, pdf and ref a connection fetches is entered under its provider and
+    id, with the DOI and accession number it is known by, its journal issue and the
+    hash of its content. Before a fetch the connection asks the catalogue whether
+    any provider already has that document, so a DOI fetched from JSTOR is not
+    downloaded again from Wiley, or from EBSCOhost under its accession number.
+"""
+
+from collections.abc import Mapping
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from .download import Download
+from .exceptions import AlreadyFetched
+
+
+COLUMNS = ('provider', 'kind', 'id', 'doi', 'an', 'digest', 'size', 'path', 'fetched')
+
+# Keys the DOI, accession number, ISSN, volume and issue have in standardised and raw refs.
+ALIASES = {
+    'doi': ('DOI', 'doi'),
+    'an': ('AN',),
+    'issn': ('ISSN', 'issn'),
+    'volume': ('Volume', 'volume', 'vol'),
+    'issue': ('Issue', 'number', 'no'),
+}
+
+
+def normalise(kind, value):
+    """ DOIs are case-insensitive; ISSNs are compared without the hyphen. """
+    if value is None:
+        return
+    value = str(value).strip()
+    if kind == 'doi':
+        value = value.lower()
+        for prefix in ('https://doi.org/', 'http://dx.doi.org/', 'doi:'):
+            if value.startswith(prefix):
+                value = value[len(prefix):]
+    elif kind == 'issn':
+        value = value.replace('-', '').upper()
+    return value or None
+
+
+def identifiers(ref):
+    """ DOI, accession number, ISSNs, volume and issue found in a ref, normalised. """
+    found = {'issn': []}
+    if not isinstance(ref, Mapping):
+        return found
+    for name, keys in ALIASES.items():
+        value = next((ref[key] for key in keys if ref.get(key) is not None), None)
+        if name == 'issn':
+            values = value if isinstance(value, (list, tuple)) else [value]
+            found['issn'] = [issn for issn in (normalise('issn', v) for v in values) if issn]
+        else:
+            found[name] = normalise(name, value)
+    return found
+
+
+class Catalogue(object):
+    """ SQLite catalogue of fetched documents, indexed on DOI, accession number,
+        ISSN with volume and issue, and content hash.
+
+        Attached to a connection object, it is consulted before every html, pdf and ref
+        call whose kind is in skip: if any provider has already fetched that kind of
+        the same document, AlreadyFetched is raised instead of sending a request.
+        Successful results are entered afterwards. Bulk refs silently drop known ids.
+
+            >>> catalogue = Catalogue('catalogue.sqlite')
+            >>> jstor = JSTOR(login=deets, catalogue=catalogue)
+            >>> wiley = Wiley(login=deets, catalogue=catalogue)
+            >>> jstor.pdf(doc_id, file='article.pdf')
+            >>> wiley.pdf(doc_id)
+            AlreadyFetched: JSTOR already fetched pdf 10.1111/... (article.pdf)
+    """
+    def __init__(self, path=None, skip=('html', 'pdf', 'ref')):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.requests_raven', 'catalogue.sqlite')
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.path = path
+        self.skip = frozenset(skip)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS fetched (provider TEXT, kind TEXT, id TEXT, doi TEXT, an TEXT, '
+                'digest TEXT, size INTEGER, path TEXT, fetched REAL, PRIMARY KEY (provider, kind, id))'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS fetched_doi ON fetched (doi)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS fetched_an ON fetched (an)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS fetched_digest ON fetched (digest)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS issues (issn TEXT, volume TEXT, issue TEXT, doi TEXT, an TEXT, '
+                'PRIMARY KEY (issn, volume, issue, doi, an))'
+            )
+
+    def _resolve(self, identifier, id):
+        # Every DOI and accession number the document is known by, one hop through earlier refs.
+        id = normalise(identifier, id)
+        dois, ans = ({id}, set()) if identifier == 'doi' else (set(), {id})
+        other = 'an' if identifier == 'doi' else 'doi'
+        rows = self._db.execute(
+            'SELECT doi, an FROM fetched WHERE {} = ? AND {} IS NOT NULL'.format(identifier, other), (id,)
+        ).fetchall()
+        for doi, an in rows:
+            dois.add(doi)
+            ans.add(an)
+        return dois, ans
+
+    def find(self, identifier, kind, id):
+        """ Entry of an earlier fetch of kind of the document whose identifier ('doi' or
+            'an') is id, by any provider; None if there is none. """
+        with self._lock:
+            dois, ans = self._resolve(identifier, id)
+            clauses, params = [], [kind]
+            if dois:
+                clauses.append('doi IN ({})'.format(', '.join('?' * len(dois))))
+                params.extend(dois)
+            if ans:
+                clauses.append('an IN ({})'.format(', '.join('?' * len(ans))))
+                params.extend(ans)
+            row = self._db.execute(
+                'SELECT {} FROM fetched WHERE kind = ? AND ({}) LIMIT 1'.format(', '.join(COLUMNS), ' OR '.join(clauses)),
+                params
+            ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def check(self, identifier, kind, id):
+        """ Raise AlreadyFetched if kind is skipped and the document has been fetched. """
+        if kind in self.skip:
+            entry = self.find(identifier, kind, id)
+            if entry is not None:
+                raise AlreadyFetched(entry)
+
+    def unknown(self, identifier, kind, ids):
+        """ Those of ids with no earlier fetch of kind; all of them if kind is not skipped. """
+        for id in ids:
+            if kind not in self.skip or self.find(identifier, kind, id) is None:
+                yield id
+
+    def add(self, provider, identifier, kind, id, value, file=None):
+        """ Enter the result of fetching kind of document id from provider.
+            value is the html text, PDF bytes or Download, or ref. """
+        digest = size = None
+        if isinstance(value, Download):
+            file, digest, size = value.path, value.sha256, value.size
+        elif isinstance(value, (bytes, str)):
+            body = value if isinstance(value, bytes) else value.encode('utf8')
+            digest, size = hashlib.sha256(body).hexdigest(), len(body)
+
+        found = identifiers(value) if kind == 'ref' else {'issn': []}
+        with self._lock, self._db:
+            dois, ans = self._resolve(identifier, id)
+            doi = found.get('doi') or (min(dois) if dois else None)
+            an = found.get('an') or (min(ans) if ans else None)
+            self._db.execute(
+                'INSERT OR REPLACE INTO fetched VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (provider, kind, str(id), doi, an, digest, size, file, time.time())
+            )
+            if found.get('volume') is not None:
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO issues VALUES (?, ?, ?, ?, ?)',
+                    [(issn, found['volume'], found.get('issue'), doi, an) for issn in found['issn']]
+                )
+
+    def issue(self, issn, volume, issue=None):
+        """ (doi, an) of every document the catalogue has in an issue of a journal. """
+        with self._lock:
+            return self._db.execute(
+                'SELECT DISTINCT doi, an FROM issues WHERE issn = ? AND volume = ? AND issue IS ?',
+                (normalise('issn', issn), str(volume), None if issue is None else str(issue))
+            ).fetchall()
+
+    def duplicates(self, kind='pdf'):
+        """ (provider, id) of the entries of kind in each group with identical content,
+            e.g. the same PDF filed under two DOIs. """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT digest, provider, id FROM fetched WHERE kind = ? AND digest IN '
+                '(SELECT digest FROM fetched WHERE kind = ? AND digest IS NOT NULL '
+                'GROUP BY digest HAVING COUNT(*) > 1) ORDER BY digest',
+                (kind, kind)
+            ).fetchall()
+        groups = {}
+        for digest, provider, id in rows:
+            groups.setdefault(digest, []).append((provider, id))
+        return list(groups.values())
+
+    def close(self):
+        self._db.close()
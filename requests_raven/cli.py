@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+""" Resumable bulk harvest from the command line.
+
+        $ requests-raven jstor dois.txt --out harvest --what ref pdf --workers 8
+
+    Reads one DOI or accession number per line and saves each document's html,
+    pdf and ref under out, sharded by a hash of the id. Every finished or failed
+    (id, kind) pair is appended to out/manifest.jsonl, so an interrupted run can
+    be started again with the same command: finished pairs are skipped, failed
+    ones are tried again and half-downloaded PDFs resume from their .part file.
+    With --catalogue, documents already fetched in any run, by any provider, are
+    recorded as duplicates of the earlier fetch instead of being downloaded.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from .batch import imap_unordered
+from .catalogue import Catalogue
+from .download import Download
+from .exceptions import AlreadyFetched
+from .pool import SessionPool
+from .records import jsonable
+from .resilience import Hedge, CircuitBreaker
+from .schedule import Scheduler
+from .store import SessionStore
+from .transport import Transport
+
+
+# Class names, looked up on the package so only the chosen provider is imported.
+PROVIDERS = {'jstor': 'JSTOR', 'wiley': 'Wiley', 'ebscohost': 'EBSCOhost', 'oxford_qje': 'OxfordQJE'}
+
+KINDS = ('html', 'pdf', 'ref')
+EXTENSIONS = {'html': '.html', 'pdf': '.pdf', 'ref': '.json'}
+
+DONE = 'done'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+
+def provider(name):
+    """ Connection class of provider name. """
+    return getattr(sys.modules[__package__], PROVIDERS[name])
+
+
+def shard_path(directory, kind, id):
+    """ Where the kind file of document id goes: directory/kind/ab/cd/<id><ext>,
+        where abcd are the first hex digits of the id's sha1, so no directory
+        holds more than a few thousand files even for millions of documents. """
+    digest = hashlib.sha1(id.encode('utf8')).hexdigest()
+    name = quote(id, safe='') + EXTENSIONS[kind]
+    return os.path.join(directory, kind, digest[:2], digest[2:4], name)
+
+
+def write_atomic(path, text):
+    """ Write text to path via a temporary file, so path is never half written. """
+    part = path + '.part'
+    with open(part, 'w', encoding='utf8') as fh:
+        fh.write(text)
+    os.replace(part, path)
+
+
+class Manifest(object):
+    """ Append-only JSONL checkpoint of a harvest: one line per finished or failed
+        (id, kind). When reopened, the last line for each pair wins; a line cut
+        short by a crash is ignored. """
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf8') as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.status[(entry['id'], entry['kind'])] = entry['status']
+        self._file = open(path, 'a', encoding='utf8')
+
+    def done(self, id, kind):
+        return self.status.get((id, kind)) in (DONE, DUPLICATE)
+
+    def counts(self):
+        """ Number of (id, kind) pairs in each status. """
+        statuses = list(self.status.values())
+        return {status: statuses.count(status) for status in (DONE, DUPLICATE, FAILED)}
+
+    def record(self, entry):
+        """ Append entry and flush it to disk. """
+        self.status[(entry['id'], entry['kind'])] = entry['status']
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def harvest(pool, id, kinds, directory, standardised=False, **kwargs):
+    """ Fetch and save every kind of document id; return a manifest entry per kind.
+        If standardised, refs are saved as standardised records.
+        Errors are recorded in the entry rather than raised. """
+    entries = []
+    for kind in kinds:
+        path = shard_path(directory, kind, id)
+        entry = {'id': id, 'kind': kind, 'status': DONE, 'path': path, 'time': time.time()}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if kind == 'pdf':
+                if os.path.exists(path):
+                    result = Download(path, os.path.getsize(path), None)
+                else:
+                    result = pool.call('pdf', id, file=path, stream=True, **kwargs)
+                if result:
+                    entry.update(size=result.size, sha256=result.sha256)
+                else:
+                    entry.update(status=FAILED, error=result.status, http_status=result.http_status)
+            elif kind == 'html':
+                write_atomic(path, pool.call('html', id, **kwargs))
+            else:
+                ref = pool.call('ref', id, standardised=standardised, **kwargs)
+                if ref is None:
+                    entry.update(status=FAILED, error='no-reference')
+                else:
+                    write_atomic(path, json.dumps(ref, default=jsonable, ensure_ascii=False))
+        except AlreadyFetched as known:
+            entry.update(status=DUPLICATE, of='{provider}:{id}'.format(**known.entry))
+            entry['path'] = known.entry['path']
+        except Exception as error:
+            entry.update(status=FAILED, error='{}: {}'.format(type(error).__name__, error))
+        if entry['status'] == FAILED or entry['path'] is None:
+            del entry['path']
+        entries.append(entry)
+    return entries
+
+
+def read_ids(file):
+    """ Ids in file, one per line; blank lines and # comments are skipped. """
+    with open(file, encoding='utf8') as fh:
+        for line in fh:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='requests-raven', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('provider', choices=sorted(PROVIDERS))
+    parser.add_argument('ids', help='file with one DOI or accession number per line')
+    parser.add_argument('--out', default='harvest', help='output directory (default: harvest)')
+    parser.add_argument('--what', nargs='+', choices=KINDS, default=list(KINDS), help='what to download')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='documents fetched in parallel, sharing the sessions evenly')
+    parser.add_argument('--sessions', type=int, default=1, help='independently authenticated sessions (default: 1)')
+    parser.add_argument('--rate', type=float, help='requests per second per host (default: unpaced)')
+    parser.add_argument('--hedge', type=float, metavar='PERCENTILE',
+                        help='resend GETs slower than this latency percentile of their host (e.g. 95)')
+    parser.add_argument('--breaker', type=int, metavar='FAILURES',
+                        help='fail fast for a host after this many consecutive failures')
+    parser.add_argument('--parse-processes', type=int, default=0, help='parse pages on this many processes')
+    parser.add_argument('--standardised', action='store_true', help='save refs with the same fields for every provider')
+    parser.add_argument('--db', help='EBSCOhost database (default: bth)')
+    parser.add_argument('--userid', help='CRSid; prompted for if missing')
+    parser.add_argument('--save-session', action='store_true', help='reuse ezproxy sessions across runs')
+    parser.add_argument('--catalogue', help='SQLite catalogue of fetched documents to skip, shared across runs')
+    args = parser.parse_args(argv)
+
+    login = {}
+    if args.userid:
+        login['userid'] = args.userid
+    if os.environ.get('RAVEN_PASSWORD'):
+        login['pwd'] = os.environ['RAVEN_PASSWORD']
+    kwargs = {'db': args.db} if args.provider == 'ebscohost' and args.db else {}
+
+    os.makedirs(args.out, exist_ok=True)
+    manifest = Manifest(os.path.join(args.out, 'manifest.jsonl'))
+    pending = (
+        (id, [kind for kind in args.what if not manifest.done(id, kind)])
+        for id in read_ids(args.ids)
+    )
+    pending = (item for item in pending if item[1])
+
+    pool = SessionPool(
+        provider(args.provider),
+        size=args.sessions,
+        share=-(-args.workers // args.sessions),
+        login=login,
+        transport=Transport(pool_maxsize=max(10, args.workers)),
+        store=SessionStore() if args.save_session else None,
+        scheduler=Scheduler(rate=args.rate) if args.rate else None,
+        parse_pool=ProcessPoolExecutor(args.parse_processes) if args.parse_processes else None,
+        catalogue=Catalogue(args.catalogue) if args.catalogue else None,
+        hedge=Hedge(percentile=args.hedge, max_workers=2 * args.workers) if args.hedge else None,
+        breaker=CircuitBreaker(failures=args.breaker) if args.breaker else None
+    )
+    try:
+        run = lambda item: harvest(pool, item[0], item[1], args.out, args.standardised, **kwargs)
+        for result in imap_unordered(run, pending, args.workers):
+            if result.error:
+                print('{}: {}'.format(result.id[0], result.error), file=sys.stderr)
+            for entry in result.value or ():
+                manifest.record(entry)
+                if entry['status'] == FAILED:
+                    print('{id} {kind}: {error}'.format(**entry), file=sys.stderr)
+    except KeyboardInterrupt:
+        print('Interrupted; run the same command again to resume.', file=sys.stderr)
+        return 130
+    finally:
+        manifest.close()
+        pool.close()
+
+    counts = manifest.counts()
+    print('{} done, {} duplicates, {} failed; manifest at {}'.format(
+        counts[DONE], counts[DUPLICATE], counts[FAILED], manifest.path), file=sys.stderr)
+    return 1 if counts[FAILED] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+import hashlib
+import os
+
+from .exceptions import NotPDFError
+
+
+# Summary of a PDF streamed to disk, returned instead of its bytes.
+Download = namedtuple('Download', ['path', 'size', 'sha256'])
+
+# Outcomes of a PDF request.
+FOUND = 'found'
+NEEDS_TERMS = 'needs-terms'
+NOT_ENTITLED = 'not-entitled'
+NOT_FOUND = 'not-found'
+UNAVAILABLE = 'unavailable'
+
+
+class Outcome(namedtuple('Outcome', ['status', 'http_status', 'url'])):
+    """ Why a PDF request did not return a PDF; returned instead of None.
+        False in boolean context, so `if not pdf:` still detects failures. """
+    __slots__ = ()
+
+    def __bool__(self):
+        return self.status == FOUND
+
+PDF_MAGIC = b'%PDF'
+
+
+def resume_offset(file):
+    """ Number of bytes of file already downloaded to file.part. """
+    part = file + '.part'
+    return os.path.getsize(part) if os.path.exists(part) else 0
+
+
+def range_headers(offset, headers=None):
+    """ Request headers asking for the body from offset onwards. """
+    headers = dict(headers or {})
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+    return headers
+
+
+def stream_pdf(get, url, file, chunk_size=65536, **kwargs):
+    """ Stream the PDF at url to file without holding it in memory.
+        get is the session's get method; extra keyword arguments are passed to it.
+        The body is written to file.part and renamed when complete. If file.part exists,
+        the transfer resumes from where it stopped with an HTTP Range request.
+        Raises NotPDFError as soon as the first bytes show the body is not a PDF. """
+    offset = resume_offset(file)
+    headers = range_headers(offset, kwargs.pop('headers', None))
+    response = get(url, headers=headers, stream=True, **kwargs)
+    return save_pdf(response, file, offset, chunk_size)
+
+
+def save_pdf(response, file, offset=0, chunk_size=65536):
+    """ Write a streamed response to file; see stream_pdf.
+        offset is the size of file.part when the request asked for a Range. """
+    part = file + '.part'
+    sha256 = hashlib.sha256()
+    try:
+        # Range not satisfiable: the previous transfer had already finished.
+        if offset and response.status_code == 416:
+            _hash_file(part, sha256, chunk_size)
+            return _finish(part, file, sha256)
+
+        # Resume only if the server honoured the Range header; otherwise start again.
+        if offset and response.status_code == 206:
+            _hash_file(part, sha256, chunk_size)
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+
+        chunks = response.iter_content(chunk_size)
+
+        # Sniff the start of a new body before writing anything to disk.
+        head = b''
+        if not offset:
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= len(PDF_MAGIC):
+                    break
+            if not head.startswith(PDF_MAGIC):
+                raise NotPDFError(response.url, response.headers.get('Content-Type'))
+
+        with open(part, mode) as fh:
+            if head:
+                fh.write(head)
+                sha256.update(head)
+            for chunk in chunks:
+                fh.write(chunk)
+                sha256.update(chunk)
+    finally:
+        response.close()
+
+    return _finish(part, file, sha256)
+
+
+def _hash_file(path, sha256, chunk_size):
+    # Feed bytes already on disk into the running hash.
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            sha256.update(chunk)
+
+
+def _finish(part, file, sha256):
+    # Rename the completed transfer into place and summarise it.
+    os.replace(part, file)
+    return Download(file, os.path.getsize(file), sha256.hexdigest())
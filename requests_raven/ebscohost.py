@@ -1,19 +1,38 @@
 # -*- coding: utf-8 -*-
 
 from requests_raven import Raven
+from requests_raven.raven import operation
+from requests_raven.download import stream_pdf, Outcome, NOT_FOUND
+from requests_raven.parsing import make_soup, EBSCO_PDF_URL
+from requests_raven.utils import LRUCache
+from requests_raven.records import Record, Author
+from requests_raven.ris import integer
+from requests_raven.exceptions import RavenError, SessionExpiredError
 from urllib.parse import urlparse, parse_qs
-import xmltodict
-from bs4 import BeautifulSoup
-from pprint import pprint
+from xml.etree.ElementTree import XMLPullParser
+from itertools import chain, islice
+import logging
+
+
+log = logging.getLogger(__name__)
+
 
 class EBSCOhost(Raven):
     """ Create Raven connection to www.ebscohost.com.
         Download HTML of document's webpage.
         Download PDF of document.
+        Session parameters (sid, vid, hid, bdata) scraped from a landing page are reused
+        for later documents and only refreshed when EBSCOhost rejects them.
     """
-    def __init__(self, login):
+    identifier = 'an'
+
+    def __init__(self, login, **kwargs):
         # Establish a Raven connection object.
-        Raven.__init__(self, url='http://search.ebscohost.com/login.aspx', login=login)
+        Raven.__init__(self, url='http://search.ebscohost.com/login.aspx', login=login, **kwargs)
+        
+        # Session parameters per database, and per document for the PDF viewer.
+        self.tokens = {}
+        self.landed = LRUCache(256)
     
     def page(self, id, db='bth'):
         # Access webpage; to be used by pdf, html & ref methods.
@@ -24,34 +43,87 @@ class EBSCOhost(Raven):
             'site':'ehost-live',
             'scope':'site'
         }
-        request = self.session.get(self.url, params=params)
+        request = self.get(self.url, params=params, phase='landing')
+        
+        # Keep the session parameters from the redirect URL.
+        tokens = self._tokens(request.url)
+        if tokens:
+            self.tokens[db] = tokens
+            self.landed.put((db, str(id)), tokens)
         return request
     
+    def landing_tokens(self, id, db='bth'):
+        # Session parameters from the landing page of id; RavenError if it has none.
+        self.page(id, db)
+        tokens = self.landed.get((db, str(id)))
+        if tokens is None:
+            raise RavenError('EBSCOhost gave no session parameters for {} in {}'.format(id, db))
+        return tokens
+    
+    @staticmethod
+    def _tokens(url):
+        # Session parameters from a landing page URL; None if EBSCOhost didn't supply them.
+        url_ps = urlparse(url)
+        url_qy = parse_qs(url_ps.query)
+        try:
+            return {
+                'base': '{}://{}'.format(url_ps.scheme, url_ps.netloc),
+                'sid': url_qy['sid'][0],
+                'vid': url_qy['vid'][0],
+                'hid': url_qy['hid'][0],
+                'bdata': url_qy.get('bdata', [])
+            }
+        except KeyError:
+            return
+    
+    def session_tokens(self, id, db='bth', refresh=False):
+        """ Return session parameters for db, requesting the landing page of id
+            only if none are held or refresh is True. """
+        if refresh or db not in self.tokens:
+            return self.landing_tokens(id, db)
+        return self.tokens[db]
+    
+    @operation
     def html(self, id, db='bth'):
         """ Download HTML of document's webpage. """
         request = self.page(id, db)
         return request.text
     
-    def pdf(self, id, file=None, db='bth'):
+    @operation
+    def pdf(self, id, file=None, db='bth', stream=False):
         """ Download PDF of document.
-            If file supplied, save to local disk. """
+            If file supplied, save to local disk.
+            If stream, write straight to file and return Download(path, size, sha256).
+            If the PDF viewer has no PDF, return a false Outcome (not-found).
+            Raises RavenError if the landing page gives no session parameters. """
+        if stream and not file:
+            raise ValueError('stream requires file')
             
-        # Get the webpage of the document.
-        request = self.page(id, db)
-        url_ps = urlparse(request.url)
-        url_qy = parse_qs(url_ps.query)
-        viewer_url = '{}://{}/ehost/pdfviewer/pdfviewer'.format(url_ps.scheme, url_ps.netloc)
-        params = {
-            'sid': url_qy['sid'][0],
-            'vid': url_qy['vid'][0],
-            'hid': url_qy['hid'][0]
-        }
-        request = self.session.get(viewer_url, params=params)
+        # The viewer shows the document last opened in the session view (vid), so reuse
+        # parameters only from this document's landing page; get the webpage otherwise.
+        for attempt in range(2):
+            tokens = self.landed.get((db, str(id)))
+            if tokens is None or attempt:
+                tokens = self.landing_tokens(id, db)
+            params = {
+                'sid': tokens['sid'],
+                'vid': tokens['vid'],
+                'hid': tokens['hid']
+            }
+            request = self.get(tokens['base'] + '/ehost/pdfviewer/pdfviewer', params=params, phase='pdfviewer')
+            
+            # Find the PDF URL; if missing, the session parameters have expired.
+            pdf_url = self.parse(parse_pdf_url, request.text, self.parser)
+            if pdf_url:
+                break
+            self.landed.pop((db, str(id)))
+        else:
+            return Outcome(NOT_FOUND, request.status_code, request.url)
         
-        # Find the PDF URL; save locally if file specified.
-        soup = BeautifulSoup(request.text, 'html.parser')
-        pdf_url = soup.find(attrs={'name': 'pdfUrl'}).attrs['value']
-        request = self.session.get(pdf_url)
+        # Save locally if file specified.
+        if stream:
+            return stream_pdf(self.get, pdf_url, file, phase='transfer')
+        request = self.get(pdf_url, phase='transfer')
         mypdf = request.content
         if file:
             with open(file, 'wb') as fh:
@@ -59,75 +131,210 @@ class EBSCOhost(Raven):
         
         return mypdf
         
-    def ref(self, id, db='bth'):
+    @operation
+    def ref(self, id, db='bth', standardised=False):
         """ Download bibliographic data of document. 
             If affiliation, find institutions affiliated with authors. """
-        
-        # Get the webpage of the document. Using parameters from initial GET,
-        # construct URL to access EBSCOhost's bibliography export function.
-        request = self.page(id, db)
-        url_ps = urlparse(request.url)
-        url_qy = parse_qs(url_ps.query)        
-        export_url = '{}://{}/ehost/delivery/ExportPanelSave/{}__{}__AN'.format(url_ps.scheme, url_ps.netloc, db, id)
-        params = {
-            'sid': url_qy['sid'][0],
-            'vid': url_qy['vid'][0],
-            'hid': url_qy['hid'][0],
-            'bdata': url_qy['bdata'],
-            'theExportFormat': 6
-        }        
-        request = self.session.get(export_url, params=params)
-        
-        # Parse XML into dictionary.
-        root = xmltodict.parse(request.text)
-        data = root['records']['rec']['header']
-        bibtex = {
-            'AN': data['@uiTerm'],
-            'url': data['displayInfo']['pLink']['url'],
-            'shortDbName': data['@shortDbName'],
-            'longDbName': data['@longDbName'],
-            'journal': data['controlInfo']['jinfo']['jtl'],
-            'issn': data['controlInfo']['jinfo']['issn'],
-            'year': data['controlInfo']['pubinfo']['dt']['@year'],
-            'month': data['controlInfo']['pubinfo']['dt']['@month'],
-            'vol': data['controlInfo']['pubinfo']['vid'],
-            'no': data['controlInfo']['pubinfo']['iid'],
-            'pg': data['controlInfo']['artinfo']['ppf'],
-            'pg_count': data['controlInfo']['artinfo']['ppct'],
-            'title': data['controlInfo']['artinfo']['tig']['atl'],
-            'subject': [x['#text'] for x in data['controlInfo']['artinfo']['sug']['subj']],
-            'abstract': data['controlInfo']['artinfo']['ab'],
-            'pubtype': data['controlInfo']['artinfo']['pubtype'],
-            'doctype': data['controlInfo']['artinfo']['doctype']
-        }
-        
-        # If author affiliations are available, return in author names & affiliations in
-        # dictionary format.
-        a_info = data['controlInfo']['artinfo']['aug']
-        affiliation = any('affil' in item for item in a_info.items())
-        authors = []
-        # ERROR; FIXED: Single authored articles come out [{'name': J}, {'name': o}, ...]
-        # Solo-authors are strings.
-        if isinstance(a_info['au'], str):
-            if affiliation:
-                authors.append({'name': a_info['au'], 'affiliation': a_info['affil']})
-            else:
-                authors.append({'name': a_info['au']})
-        # Multiple authors are lists.
+        bibtex = next(self._export([id], db), None)
+        if standardised and bibtex is not None:
+            bibtex = standardise(bibtex).as_dict()
+        return bibtex
+    
+    def refs(self, ids, db='bth', batch=50, standardised=False):
+        """ Download bibliographic data of many documents, batch ANs per request.
+            Yields one record per document in the order EBSCOhost returns them.
+            Raises SessionExpiredError if EBSCOhost answers with an error page.
+            Documents already in the catalogue, if there is one, are left out. """
+        ids = iter(self.unknown(ids))
+        while True:
+            chunk = list(islice(ids, batch))
+            if not chunk:
+                return
+            for bibtex in self.catalogued(self._export(chunk, db), 'AN'):
+                yield standardise(bibtex) if standardised else bibtex
+    
+    def _export(self, ids, db='bth'):
+        # Using session parameters from a landing page, construct URL to access
+        # EBSCOhost's bibliography export function. The ANs are part of the URL, so
+        # parameters from any document in the same database will do.
+        items = ','.join('{}__{}__AN'.format(db, id) for id in ids)
+        for attempt in range(2):
+            tokens = self.session_tokens(ids[0], db, refresh=bool(attempt))
+            export_url = '{}/ehost/delivery/ExportPanelSave/{}'.format(tokens['base'], items)
+            params = {
+                'sid': tokens['sid'],
+                'vid': tokens['vid'],
+                'hid': tokens['hid'],
+                'bdata': tokens['bdata'],
+                'theExportFormat': 6
+            }
+            request = self.get(export_url, params=params, stream=True, phase='export')
+            
+            # An expired session returns an error page instead of the XML export.
+            chunks = request.iter_content(65536)
+            head = b''
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= 1024:
+                    break
+            if b'<records' in head:
+                break
+            request.close()
         else:
-            for n in range(len(a_info['au'])):
-                if affiliation:
-                    # If only one affiliation for all authors.
-                    if isinstance(a_info['affil'], str):
-                        authors.append({'name': a_info['au'][n], 'affiliation': a_info['affil']})
-                    # If more or fewer affiliations than authors.
-                    elif len(a_info['affil']) != len(a_info['au']):
-                        authors.append({'name': a_info['au'][n], 'affiliation': ' '.join(a_info['affil'])})
-                    # If number of affiliations equals number of authors.
-                    else:
-                        authors.append({'name': a_info['au'][n], 'affiliation': a_info['affil'][n]})
-                else:
-                    authors.append({'name': a_info['au'][n]})
-        bibtex['authors'] = authors
+            # Refreshed parameters didn't help either: the session itself has expired.
+            raise SessionExpiredError(request.url)
         
-        return bibtex
+        # Parse the XML as it streams in, yielding each record once its </rec> arrives
+        # and then dropping it, so memory use doesn't grow with the batch.
+        parser = XMLPullParser(events=('start', 'end'))
+        root = None
+        try:
+            for chunk in chain([head], chunks):
+                records = []
+                with self.timed('parse'):
+                    parser.feed(chunk)
+                    for event, element in parser.read_events():
+                        if root is None:
+                            root = element
+                        elif event == 'end' and element.tag == 'rec':
+                            header = element.find('header')
+                            try:
+                                records.append(record(element_dict(header)))
+                            except (KeyError, TypeError, AttributeError) as error:
+                                # One malformed record shouldn't lose the rest of the batch.
+                                an = header.get('uiTerm') if header is not None else None
+                                log.warning('Skipped EBSCOhost record %s: %r', an, error)
+                            root.clear()
+                for bibtex in records:
+                    yield bibtex
+            parser.close()
+        finally:
+            request.close()
+
+
+def parse_pdf_url(html, backend=None):
+    """ URL of the PDF from EBSCOhost's PDF viewer page; None if the page has none. """
+    soup = make_soup(html, EBSCO_PDF_URL, backend)
+    found = soup.find(attrs={'name': 'pdfUrl'})
+    return found.attrs['value'] if found else None
+
+
+def element_dict(element):
+    """ An ElementTree element as xmltodict would give it: attributes as '@name',
+        children by tag (lists if repeated), text as '#text' next to attributes or
+        children, and the bare text for a plain leaf. """
+    node = {'@' + name: value for name, value in element.attrib.items()}
+    for child in element:
+        value = element_dict(child)
+        if child.tag not in node:
+            node[child.tag] = value
+        elif isinstance(node[child.tag], list):
+            node[child.tag].append(value)
+        else:
+            node[child.tag] = [node[child.tag], value]
+    text = ''.join([element.text or ''] + [child.tail or '' for child in element]).strip()
+    if not node:
+        return text or None
+    if text:
+        node['#text'] = text
+    return node
+
+
+def find_doi(ui):
+    """ DOI among the <ui> identifiers of an <artinfo>; None if it has none. """
+    for item in ui if isinstance(ui, list) else [ui]:
+        if isinstance(item, dict) and item.get('@type') == 'doi':
+            return item.get('#text')
+
+
+def listed(value):
+    """ value as a list: [] for a missing element, [value] for one that isn't repeated. """
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def text(value):
+    """ Text of an element from element_dict, whether or not it has attributes. """
+    return value.get('#text') if isinstance(value, dict) else value
+
+
+def record(data):
+    """ Bibliographic data of one exported <rec>; data is its <header> from element_dict.
+        Elements a record lacks (abstract, subjects, authors, ...) come out as None or []. """
+    control = data.get('controlInfo') or {}
+    jinfo = control.get('jinfo') or {}
+    pubinfo = control.get('pubinfo') or {}
+    date = pubinfo.get('dt') or {}
+    artinfo = control.get('artinfo') or {}
+    link = (data.get('displayInfo') or {}).get('pLink') or {}
+    bibtex = {
+        'AN': data['@uiTerm'],
+        'doi': find_doi(artinfo.get('ui')),
+        'url': link.get('url'),
+        'shortDbName': data.get('@shortDbName'),
+        'longDbName': data.get('@longDbName'),
+        'journal': text(jinfo.get('jtl')),
+        'issn': text(jinfo.get('issn')),
+        'year': date.get('@year'),
+        'month': date.get('@month'),
+        'vol': text(pubinfo.get('vid')),
+        'no': text(pubinfo.get('iid')),
+        'pg': text(artinfo.get('ppf')),
+        'pg_count': text(artinfo.get('ppct')),
+        'title': text((artinfo.get('tig') or {}).get('atl')),
+        'subject': [text(x) for x in listed((artinfo.get('sug') or {}).get('subj'))],
+        'abstract': text(artinfo.get('ab')),
+        'pubtype': text(artinfo.get('pubtype')),
+        'doctype': text(artinfo.get('doctype'))
+    }
+    
+    # Authors, with affiliations if there are any: one per author in order if the
+    # counts match, the only one for everybody, or all of them joined otherwise.
+    aug = artinfo.get('aug') or {}
+    names = [text(name) for name in listed(aug.get('au'))]
+    affiliations = [text(affiliation) for affiliation in listed(aug.get('affil'))]
+    authors = []
+    for n, name in enumerate(names):
+        author = {'name': name}
+        if len(affiliations) == len(names):
+            author['affiliation'] = affiliations[n]
+        elif len(affiliations) == 1:
+            author['affiliation'] = affiliations[0]
+        elif affiliations:
+            author['affiliation'] = ' '.join(affiliations)
+        authors.append(author)
+    bibtex['authors'] = authors
+    
+    return bibtex
+
+
+def number(value):
+    """ Integer if value is a number, its text otherwise; None if missing. """
+    return integer(value) if value else None
+
+
+def standardise(bibtex):
+    """ Standardised Record from record's dictionary. """
+    standard = Record(
+        AN=bibtex['AN'],
+        DOI=bibtex.get('doi'),
+        Title=bibtex['title'],
+        Journal=bibtex['journal'],
+        ISSN=[bibtex['issn']] if bibtex['issn'] else [],
+        Year=number(bibtex['year']),
+        Volume=number(bibtex['vol']),
+        Issue=bibtex['no'],
+        FirstPage=number(bibtex['pg']),
+        Abstract=bibtex['abstract'],
+        Keywords=bibtex['subject'],
+        Authors=[Author(Name=author['name'], Affiliation=author.get('affiliation')) for author in bibtex['authors']]
+    )
+    if bibtex['year'] and bibtex['month']:
+        standard.PubDate = '{}-{:0>2}-01'.format(bibtex['year'], bibtex['month'])
+    
+    # Last page from first page and page count.
+    count = number(bibtex['pg_count'])
+    if isinstance(standard.FirstPage, int) and isinstance(count, int) and count:
+        standard.LastPage = standard.FirstPage + count - 1
+    return standard
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+
+class RavenError(Exception):
+    """ Base class for errors raised by requests_raven. """
+
+
+class NotPDFError(RavenError):
+    """ A PDF was requested but the server returned something else, usually an HTML error page. """
+    def __init__(self, url, content_type=None):
+        RavenError.__init__(self, 'Not a PDF ({}): {}'.format(content_type, url))
+        self.url = url
+        self.content_type = content_type
+
+
+class SessionExpiredError(RavenError):
+    """ ezproxy redirected a request back to the Raven or ezproxy login pages. """
+    def __init__(self, url):
+        RavenError.__init__(self, 'Session expired; redirected to login: {}'.format(url))
+        self.url = url
+
+
+class AlreadyFetched(RavenError):
+    """ The catalogue has an earlier fetch of the document, by this or another provider.
+        entry is the catalogue's record of it: provider, kind, id, doi, an, digest, size, path. """
+    def __init__(self, entry):
+        RavenError.__init__(self, '{provider} already fetched {kind} {id}'.format(**entry) +
+                            (' ({path})'.format(**entry) if entry.get('path') else ''))
+        self.entry = entry
+
+
+class CircuitOpenError(RavenError):
+    """ The circuit breaker is failing requests to host fast after repeated failures.
+        retry_after is the number of seconds until a trial request is let through. """
+    def __init__(self, host, retry_after):
+        RavenError.__init__(self, 'Circuit open for {}; retry in {:.0f}s'.format(host, retry_after))
+        self.host = host
+        self.retry_after = retry_after
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 
 from requests_raven import Raven
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import convert_to_unicode
-from bs4 import BeautifulSoup
-from pprint import pprint
+from requests_raven.raven import operation
+from requests_raven.download import resume_offset, range_headers, save_pdf
+from requests_raven.download import Outcome, NEEDS_TERMS, NOT_ENTITLED, NOT_FOUND, UNAVAILABLE
+from requests_raven.bibtex import parse as bibtex_parse
+from requests_raven.parsing import make_soup
+from requests_raven.records import Record, Author
+from requests_raven.affiliations import AffiliationIndex, text_pairs, within
 
 class JSTOR(Raven):
     """ Create Raven connection to www.jstor.org.
@@ -13,115 +15,167 @@ class JSTOR(Raven):
         Download PDF of document.
         Download bibliographic data of docuemnt.
     """
-    def __init__(self, login):
+    def __init__(self, login, **kwargs):
         # Establish a Raven connection object.
-        Raven.__init__(self, url='http://www.jstor.org', login=login)
+        Raven.__init__(self, url='http://www.jstor.org', login=login, **kwargs)
+        
+        # Whether JSTOR's terms and conditions have been accepted in this session.
+        self.terms_accepted = False
+    
+    def reauthenticate(self):
+        """ Log in again; the new session has not accepted the terms. """
+        Raven.reauthenticate(self)
+        self.terms_accepted = False
     
+    @operation
     def html(self, id):
         """ Download html of document's webpage. """
         html_url = '{}/stable/info/{}'.format(self.url, id)
-        request = self.session.get(html_url)
+        request = self.get(html_url, phase='page')
         return request.text
     
-    def pdf(self, id, file=None, params={'acceptTC': 'true'}, redirect=4):
+    @operation
+    def pdf(self, id, file=None, params={'acceptTC': 'true'}, redirect=4, stream=False):
         """ Download pdf of document.
-            If file supplied, save to local disk. """
+            If file supplied, save to local disk.
+            If stream, write straight to file and return Download(path, size, sha256).
+            If there is no PDF, return a false Outcome saying why (needs-terms,
+            not-entitled, not-found, or unavailable for any other error status). """
         
         # Downloading PDFs on JSTOR requires accepting the TOCs (done via acceptTC=true in params).
         # Need to make initial request and then a second request the first time you download a PDF
-        # using your Raven object. Set to make a maximum of 4 requests, just to be safe.
+        # using your Raven object; once accepted, one request settles every later PDF.
+        # Set to make a maximum of 4 requests, just to be safe.
+        if stream and not file:
+            raise ValueError('stream requires file')
+        pdf_url = '{}/stable/pdfplus/{}.pdf'.format(self.url, id)
+        outcome = Outcome(NEEDS_TERMS, None, pdf_url)
         for n in range(0, redirect):
-            pdf_url = '{}/stable/pdfplus/{}.pdf'.format(self.url, id)
-            request = self.session.get(pdf_url, params=params)
-            if 'application/pdf' in request.headers['Content-Type']:
+            offset = resume_offset(file) if stream else 0
+            request = self.get(pdf_url, params=params, headers=range_headers(offset), stream=True, phase='transfer')
+            
+            # Check the headers before reading any of the body. A resumed transfer
+            # answered 416 had already finished; save_pdf completes it.
+            if 'application/pdf' in request.headers.get('Content-Type', '') or (offset and request.status_code == 416):
+                self.terms_accepted = True
+                if stream:
+                    return save_pdf(request, file, offset)
                 mypdf = request.content
                 if file:
                     with open(file, 'wb') as fh:
                         fh.write(mypdf)
                 return mypdf
+            request.close()
+            
+            outcome = Outcome(NEEDS_TERMS, request.status_code, request.url)
+            if request.status_code in (404, 410):
+                return Outcome(NOT_FOUND, request.status_code, request.url)
+            if request.status_code in (401, 403):
+                return Outcome(NOT_ENTITLED, request.status_code, request.url)
+            if request.status_code >= 400:
+                return Outcome(UNAVAILABLE, request.status_code, request.url)
+            
+            # Terms already accepted, so a page instead of the PDF says no access.
+            if self.terms_accepted:
+                return Outcome(NOT_ENTITLED, request.status_code, request.url)
         
-        # If number of redirects exceeded, return None.
-        print("PDF not found.")
-        return
+        # Terms page every time: acceptance didn't stick.
+        return outcome
     
+    @operation
     def ref(self, id, affiliation=False, standardised=True):
         """ Download bibliographic data of document. 
-            If affiliation, find institutions affiliated with authors. """
-        
-        # Return integer if number.
-        def make_integer(s):
-            try:
-                return int(s)
-            except ValueError:
-                return s
-        
+            If affiliation, find institutions affiliated with authors.
+            If standardised, return a plain dictionary of the Record fields. """
         ref_url = '{}/citation/text/{}'.format(self.url, id)
-        request = self.session.get(ref_url)
-        text = request.content.decode('utf8').replace(u'\xa0', u' ')
-        
-        # Parse BibTeX.
-        try:
-            parser = BibTexParser()
-            parser.customization = convert_to_unicode
-            bibtex = bibtexparser.loads(text, parser=parser).entries[0]
-        except IndexError:
+        request = self.get(ref_url, phase='export')
+        bibtex = self.parse(parse_ref, request.content, standardised)
+        if bibtex is None:
             return
         
-        # Change 'author' to list of dictionaries with key value 'authors'.
-        if 'author' in bibtex:
-            bibtex['authors'] = bibtex.pop('author')
-            bibtex['authors'] = list(map(str.strip, bibtex['authors'].split(',')))
-            bibtex['authors'] = [{'Name': x} for x in bibtex['authors']]
-        
-        bibtex['issn'] = list(map(str.strip, bibtex['issn'].split(',')))
-        bibtex['year'] = int(bibtex['year'])
-        
         # If affiliation keyword is true, attempt to find each author's affiliation
         # in the text of the HTML.
-        if affiliation:
+        authors = bibtex.get('Authors' if standardised else 'authors')
+        if affiliation and authors:
             html = self.html(id=id)
-            soup = BeautifulSoup(html, 'html.parser')
-            authinfo = soup.find('div', class_='authorInfo')
-            if authinfo:
-                for n in range(len(bibtex['authors'])):
-                    regex = '\s'.join(bibtex['authors'][n]['Name'].split())
-                    affiliation = authinfo.find(string=re.compile(regex, re.UNICODE))
-                    if affiliation:
-                        bibtex['authors'][n]['Affiliation'] = affiliation.next_element.string.strip()
+            found = self.parse(parse_affiliations, html, [author['Name'] for author in authors], self.parser)
+            for author, affiliation in zip(authors, found):
+                if affiliation:
+                    author['Affiliation'] = affiliation
         
-        # If standardised keyword is true, return standardised bibliography reference.
-        # Fixed: number not always in bibtex.
-        if standardised:
-            standard = {
-                'Journal': bibtex['journal'],
-                'Volume': bibtex['volume'],
-                'DOI': bibtex['ID'],
-                'ISSN': bibtex['issn'],
-                'Year': bibtex['year']
-            }
-            
-            if 'number' in bibtex:
-                standard['Issue'] = bibtex['number'].strip()
-            
-            if 'abstract' in bibtex:
-                standard['Abstract'] = bibtex['abstract'].strip()
-            
-            if 'title' in bibtex:
-                standard['Title'] = bibtex['title']
-            
-            if 'authors' in bibtex:
-                standard['Authors'] = bibtex['authors']
-            
-            # Page numbers.
-            if 'pages' in bibtex:
-                pages = bibtex['pages'].split('-')
-                standard['FirstPage'] = make_integer(pages[0])
-                standard['LastPage'] = make_integer(pages[1])
-                if isinstance(standard['FirstPage'], int) and isinstance(standard['LastPage'], int):
-                    if standard['LastPage'] < standard['FirstPage']:
-                        substr = len(str(standard['FirstPage'])) - len(str(standard['LastPage']))
-                        standard['LastPage'] = int(str(standard['FirstPage'])[:substr] + str(standard['LastPage']))
-            
-            bibtex = standard
-                        
-        return bibtex
+        return bibtex.as_dict() if standardised else bibtex
+
+
+def parse_ref(content, standardised=True):
+    """ Bibliographic data from the bytes of JSTOR's BibTeX export; None if empty. """
+    
+    # Return integer if number.
+    def make_integer(s):
+        try:
+            return int(s)
+        except ValueError:
+            return s
+    
+    text = content.decode('utf8').replace(u'\xa0', u' ')
+    entries = bibtex_parse(text)
+    if not entries:
+        return
+    bibtex = entries[0]
+    
+    # Change 'author' to list of dictionaries with key value 'authors'.
+    if 'author' in bibtex:
+        bibtex['authors'] = bibtex.pop('author')
+        bibtex['authors'] = list(map(str.strip, bibtex['authors'].split(',')))
+        author = Author if standardised else dict
+        bibtex['authors'] = [author(Name=x) for x in bibtex['authors']]
+    
+    bibtex['issn'] = list(map(str.strip, bibtex['issn'].split(',')))
+    bibtex['year'] = int(bibtex['year'])
+    
+    # If standardised keyword is true, return standardised bibliography reference.
+    # Fixed: number not always in bibtex.
+    if standardised:
+        standard = Record(
+            Journal=bibtex['journal'],
+            Volume=make_integer(bibtex['volume']),
+            DOI=bibtex['ID'],
+            ISSN=bibtex['issn'],
+            Year=bibtex['year']
+        )
+        
+        if 'number' in bibtex:
+            standard['Issue'] = bibtex['number'].strip()
+        
+        if 'abstract' in bibtex:
+            standard['Abstract'] = bibtex['abstract'].strip()
+        
+        if 'title' in bibtex:
+            standard['Title'] = bibtex['title']
+        
+        if 'authors' in bibtex:
+            standard['Authors'] = bibtex['authors']
+        
+        # Page numbers.
+        if 'pages' in bibtex:
+            pages = bibtex['pages'].split('-')
+            standard['FirstPage'] = make_integer(pages[0])
+            standard['LastPage'] = make_integer(pages[1])
+            if isinstance(standard['FirstPage'], int) and isinstance(standard['LastPage'], int):
+                if standard['LastPage'] < standard['FirstPage']:
+                    substr = len(str(standard['FirstPage'])) - len(str(standard['LastPage']))
+                    standard['LastPage'] = int(str(standard['FirstPage'])[:substr] + str(standard['LastPage']))
+        
+        bibtex = standard
+    
+    return bibtex
+
+
+def parse_affiliations(html, names, backend=None):
+    """ Affiliation of each of names found in the authorInfo block of a JSTOR page; None if not found. """
+    soup = make_soup(html, 'div', backend)
+    authinfo = soup.find('div', class_='authorInfo')
+    if not authinfo:
+        return [None] * len(names)
+    pairs = list(text_pairs(authinfo))
+    found = AffiliationIndex(pairs).resolve(names)
+    return [affiliation or within(name, pairs) for name, affiliation in zip(names, found)]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+import json
+import threading
+
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+
+class Histogram(object):
+    """ Fixed-bucket histogram: observing a value is a binary search and an increment. """
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ (upper bound, count of values <= bound) pairs, as Prometheus expects. """
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            yield bound, total
+
+    def as_dict(self):
+        return {
+            'buckets': {str(bound): count for bound, count in self.cumulative()},
+            'sum': self.sum,
+            'count': self.count
+        }
+
+
+class Series(object):
+    """ Everything recorded for one (provider, method, phase). """
+    __slots__ = ('seconds', 'bytes', 'status')
+
+    def __init__(self):
+        self.seconds = Histogram()
+        self.bytes = 0
+        self.status = {}
+
+
+class Metrics(object):
+    """ Request-level instrumentation shared by connection objects.
+        Every request is tagged with provider (connection class), method (html, pdf,
+        ref, or auth for the handshake) and phase (e.g. search, landing, pdfviewer,
+        transfer, export), and its latency, bytes and status are recorded. Parsing
+        is recorded under phase parse. Callbacks receive each observation as a
+        dictionary; snapshot, json and prometheus export the totals.
+
+            >>> metrics = Metrics()
+            >>> conn = JSTOR(login=deets, metrics=metrics)
+            >>> print(metrics.prometheus())
+    """
+    def __init__(self):
+        self.series = {}
+        self.callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """ Call callback(observation) for every observation. """
+        self.callbacks.append(callback)
+
+    def observe(self, provider, method, phase, seconds, nbytes=0, status=None):
+        """ Record one request, or one parse if status is None. """
+        key = (provider, method or '', phase)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series()
+            series.seconds.observe(seconds)
+            series.bytes += nbytes
+            if status is not None:
+                series.status[status] = series.status.get(status, 0) + 1
+        if self.callbacks:
+            observation = {
+                'provider': provider, 'method': method, 'phase': phase,
+                'seconds': seconds, 'bytes': nbytes, 'status': status
+            }
+            for callback in self.callbacks:
+                callback(observation)
+
+    def snapshot(self):
+        """ List of dictionaries, one per (provider, method, phase). """
+        with self._lock:
+            return [
+                {
+                    'provider': provider, 'method': method, 'phase': phase,
+                    'seconds': series.seconds.as_dict(),
+                    'bytes': series.bytes,
+                    'status': {str(k): v for k, v in series.status.items()}
+                }
+                for (provider, method, phase), series in sorted(self.series.items())
+            ]
+
+    def json(self):
+        """ Snapshot as a JSON string. """
+        return json.dumps(self.snapshot())
+
+    def prometheus(self):
+        """ Snapshot in the Prometheus text exposition format. """
+        with self._lock:
+            items = [
+                ('provider="{}",method="{}",phase="{}"'.format(*key), series)
+                for key, series in sorted(self.series.items())
+            ]
+            lines = ['# TYPE requests_raven_seconds histogram']
+            for labels, series in items:
+                for bound, count in series.seconds.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('requests_raven_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, count))
+                lines.append('requests_raven_seconds_sum{{{}}} {}'.format(labels, series.seconds.sum))
+                lines.append('requests_raven_seconds_count{{{}}} {}'.format(labels, series.seconds.count))
+            lines.append('# TYPE requests_raven_bytes_total counter')
+            for labels, series in items:
+                lines.append('requests_raven_bytes_total{{{}}} {}'.format(labels, series.bytes))
+            lines.append('# TYPE requests_raven_responses_total counter')
+            for labels, series in items:
+                for status, count in sorted(series.status.items()):
+                    lines.append('requests_raven_responses_total{{{},status="{}"}} {}'.format(labels, status, count))
+        return '\n'.join(lines) + '\n'
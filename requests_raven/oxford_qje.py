@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from requests_raven import Raven
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import convert_to_unicode
-from bs4 import BeautifulSoup
+from requests_raven.raven import operation, run_operation
+from requests_raven.download import stream_pdf, PDF_MAGIC
+from requests_raven.utils import LRUCache
+from requests_raven.bibtex import parse as bibtex_parse
+from requests_raven.parsing import make_soup, OXFORD_SEARCH
+from requests_raven.records import Record, Author
+from requests_raven.affiliations import AffiliationIndex, meta_pairs
+from requests_raven.exceptions import NotPDFError
 import re
 
 class OxfordQJE(Raven):
@@ -12,150 +16,215 @@ class OxfordQJE(Raven):
         Download HTML of document's webpage.
         Download PDF of document.
         Download bibliographic data of document.
+        Fetch any combination of the three with the fewest requests.
     """
     
-    def __init__(self, login):
+    def __init__(self, login, search_cache=256, **kwargs):
         # Establish a Raven connection object.
-        Raven.__init__(self, url='http://qje.oxfordjournals.org', login=login)
+        Raven.__init__(self, url='http://qje.oxfordjournals.org', login=login, **kwargs)
+        
+        # Links found by search, memoized per DOI.
+        self.links = LRUCache(search_cache)
         
     def search(self, id):
         # Access links from DOI search; to be used by pdf, html & ref methods.
+        links = self.links.get(id)
+        if links is not None:
+            return links
+        
         params = {'submit': 'yes', 'doi': id}
         search_url = self.url + '/search'
-        request = self.session.get(search_url, params=params)
-        soup = BeautifulSoup(request.text, 'html.parser')
-        
-        # HTML appears to have changed; added new way to obtain link.
-        try:
-            frame_link = soup.find(attrs={'rel': 'full-text.pdf'})['href']
-            issue = re.search('(content|reprint)/(?P<vol>\d+)/(?P<num>\d+)/(?P<page>\d+).*\?sid=(?P<sid>.*)', frame_link).groupdict()
-            gca = 'qje;{}/{}/{}'.format(issue['vol'], issue['num'], issue['page'])
-            html_link = '{}/content/{}/{}/{}.abstract?sid={}'.format(self.url, issue['vol'], issue['num'], issue['page'], issue['sid'])
-            pdf_link = '{}/content/{}/{}/{}.full.pdf'.format(self.url, issue['vol'], issue['num'], issue['page'])
-            
-        except AttributeError:
-            found_html = soup.find('div', 'cit-extra')
-            html_link = found_html.find(attrs={'rel': 'abstract'})['href']
-            pdf_link = found_html.find(attrs={'rel': 'full-text.pdf'})['href'].replace('pdf+html', 'pdf')
-            gca = soup.find(attrs={'name': 'gca'})['value']
-        
-        return {'html': html_link, 'pdf': pdf_link, 'gca': gca}
+        request = self.get(search_url, params=params, phase='search')
+        links = self.parse(parse_search, request.text, self.url, self.parser)
+        self.links.put(id, links)
+        return links
     
+    @operation
     def html(self, id):
         """ Download HTML of document's webpage. """
         links = self.search(id)
-        request = self.session.get(links['html'])
+        request = self.get(links['html'], phase='page')
         return request.text
         
-    def pdf(self, id, file=None):
+    @operation
+    def pdf(self, id, file=None, stream=False):
         """ Download PDF of document.
-            If file supplied, save to local disk. """
+            If file supplied, save to local disk.
+            If stream, write straight to file and return Download(path, size, sha256).
+            Raises NotPDFError if Oxford answers with something other than a PDF. """
+        if stream and not file:
+            raise ValueError('stream requires file')
             
         links = self.search(id)
-        request = self.session.get(links['pdf'])
+        if stream:
+            return stream_pdf(self.get, links['pdf'], file, phase='transfer')
+        request = self.get(links['pdf'], phase='transfer')
         
-        # Save locally if file specified.
+        # Make sure it's a PDF; save locally if file specified.
         mypdf = request.content
-        # TO DO: CHECK TO MAKE SURE ITS A PDF.
+        if not mypdf.startswith(PDF_MAGIC):
+            raise NotPDFError(request.url, request.headers.get('Content-Type'))
         if file:
             with open(file, 'wb') as fh:
                 fh.write(mypdf)
         
         return mypdf
     
+    def fetch(self, id, html=True, pdf=True, ref=True, affiliation=False, standardised=False, file=None, stream=False):
+        """ Download any of the HTML, PDF and bibliographic data of document in one go.
+            The search and the abstract page are each requested once and shared.
+            Each item is cached, catalogued and measured as if its own method was called.
+            Returns dictionary with html, pdf and ref keys for the items requested. """
+        fetched = {}
+        page = None
+        if html:
+            page = fetched['html'] = self.html(id)
+        if pdf:
+            fetched['pdf'] = self.pdf(id, file=file, stream=stream)
+        if ref:
+            reuse = lambda conn, id, **kwargs: conn._ref(id, page=page, **kwargs)
+            fetched['ref'] = run_operation(self, 'ref', reuse, id, (), {'affiliation': affiliation, 'standardised': standardised})
+        return fetched
+    
+    @operation
     def ref(self, id, affiliation=False, standardised=False):
         """ Download bibliographic data of document. 
             If affiliation, find institutions affiliated with authors. """
+        return self._ref(id, affiliation, standardised)
+    
+    def _ref(self, id, affiliation=False, standardised=False, page=None):
+        # Body of ref; page is the abstract page's HTML if already downloaded.
         
         # Export Bibtex.
         links = self.search(id)
         
         params = {'type': 'bibtex', 'gca' : links['gca']}
-        request = self.session.get(self.url+'/citmgr', params=params)
+        request = self.get(self.url+'/citmgr', params=params, phase='export')
         
-        # Parse Bibtex.
-        text = request.content.decode('utf8').replace(u'\xa0', u' ')
-        try:
-            parser = BibTexParser()
-            parser.customization = convert_to_unicode
-            bibtex = bibtexparser.loads(text, parser=parser).entries[0]
-        except IndexError:
+        bibtex = self.parse(parse_ref, request.content)
+        if bibtex is None:
             return
         
         # Make sure you got the right record!
         assert id == bibtex['doi']
         
-        bibtex['authors'] = bibtex.pop('author')
-        bibtex['authors'] = list(map(str.strip, bibtex['authors'].split(' and ')))
-        bibtex['authors'] = [{'name': x} for x in bibtex['authors']]
-        
         # If affiliation keyword is true, attempt to find each author's affiliation
         # in the text of the HTML.
         if affiliation:
-            request = self.session.get(links['html'])
-            soup = BeautifulSoup(request.text, 'html.parser')
-            
-            try:
-                citation_authors = soup.find("ol", class_="affiliation-list").find_all('address')
-                citation_authors = [x.text.strip() for x in citation_authors if x != '\n']
-                if len(citation_authors) == len(bibtex['authors']):
-                    for n in range(len(bibtex['authors'])):
-                        bibtex['authors'][n]['affiliation'] = citation_authors[n]
-                else:
-                    for n in range(len(bibtex['authors'])):
-                        bibtex['authors'][n]['affiliation'] = ' '.join(citation_authors)
-            except AttributeError:
-                for n in range(len(bibtex['authors'])):
-                    bibtex['authors'][n]['affiliation'] = None
+            if page is None:
+                page = self.get(links['html'], phase='page').text
+            names = [author['name'] for author in bibtex['authors']]
+            found = self.parse(parse_affiliations, page, names, self.parser)
+            for author, affiliation in zip(bibtex['authors'], found):
+                author['affiliation'] = affiliation
         
         # If standardised, return a standardised set of bibliographic information;
         # otherwise, ref returns whatever is returned by Oxford's citation tool.
         if standardised:
-            standard = {
-                'Volume': int(bibtex['volume']),
-                'Issue': bibtex['number'],
-                'Title': bibtex['title'].strip(),
-                'Journal': 'QJE',
-                'DOI': bibtex['doi'],
-                'Abstract': bibtex['abstract'].strip(),
-                'JEL': [],
-                'Authors': []
-            }
+            bibtex = standardise(bibtex).as_dict()
+        
+        return bibtex
 
-            # Publication date.
-            if bibtex['number'] == '1':
-                standard['PubDate'] = '{}-02-01'.format(bibtex['year'])
-            elif bibtex['number'] == '2':
-                standard['PubDate'] = '{}-05-01'.format(bibtex['year'])
-            elif bibtex['number'] == '3':
-                standard['PubDate'] = '{}-08-01'.format(bibtex['year'])
-            elif bibtex['number'] == '4':
-                standard['PubDate'] = '{}-11-01'.format(bibtex['year'])
-            elif bibtex['number'] == 'Supplement':
-                standard['PubDate'] = '{}-01-01'.format(bibtex['year'])
 
-            # Page numbers.
-            pages = bibtex['pages'].split('-')
-            standard['FirstPage'] = int(pages[0])
-            standard['LastPage'] = int(pages[1])
-            if standard['LastPage'] < standard['FirstPage']:
-                substr = len(str(standard['FirstPage'])) - len(str(standard['LastPage']))
-                standard['LastPage'] = int(str(standard['FirstPage'])[:substr] + str(standard['LastPage']))
+def parse_search(html, base_url, backend=None):
+    """ Abstract page, PDF and citation export (gca) links from an Oxford DOI search page. """
+    soup = make_soup(html, OXFORD_SEARCH, backend)
     
-            # Find JEL classification codes.
-            jel_regex = re.compile(r'(.*) JEL Codes?: (.*)\.$')
-            jel_regex_match = jel_regex.search(bibtex['abstract'])
-            if jel_regex_match:
-                standard['Abstract'] = jel_regex_match.group(1).strip()
-                standard['JEL'] = [x.strip() for x in jel_regex_match.group(2).split(',')]
+    # HTML appears to have changed; added new way to obtain link.
+    try:
+        frame_link = soup.find(attrs={'rel': 'full-text.pdf'})['href']
+        issue = re.search(r'(content|reprint)/(?P<vol>\d+)/(?P<num>\d+)/(?P<page>\d+).*\?sid=(?P<sid>.*)', frame_link).groupdict()
+        gca = 'qje;{}/{}/{}'.format(issue['vol'], issue['num'], issue['page'])
+        html_link = '{}/content/{}/{}/{}.abstract?sid={}'.format(base_url, issue['vol'], issue['num'], issue['page'], issue['sid'])
+        pdf_link = '{}/content/{}/{}/{}.full.pdf'.format(base_url, issue['vol'], issue['num'], issue['page'])
+        
+    except AttributeError:
+        # Only the links are parsed; the result's abstract link is the first one.
+        html_link = soup.find(attrs={'rel': 'abstract'})['href']
+        pdf_link = frame_link.replace('pdf+html', 'pdf')
+        gca = soup.find(attrs={'name': 'gca'})['value']
+    
+    return {'html': html_link, 'pdf': pdf_link, 'gca': gca}
 
-            # Author
-            for author in bibtex['authors']:
-                aut = {'Name': author['name']}
-                if 'affiliation' in author:
-                    aut['Affiliation'] = author['affiliation']
-                standard['Authors'].append(aut)
-            
-            bibtex = standard
-                    
-        return bibtex
+
+def parse_ref(content):
+    """ Bibliographic data from the bytes of Oxford's BibTeX export; None if empty. """
+    text = content.decode('utf8').replace(u'\xa0', u' ')
+    entries = bibtex_parse(text)
+    if not entries:
+        return
+    bibtex = entries[0]
+    
+    bibtex['authors'] = bibtex.pop('author')
+    bibtex['authors'] = list(map(str.strip, bibtex['authors'].split(' and ')))
+    bibtex['authors'] = [{'name': x} for x in bibtex['authors']]
+    return bibtex
+
+
+def parse_affiliations(html, names, backend=None):
+    """ Affiliation of each of names on an abstract page, from its citation_author meta
+        tags. Authors whose name isn't there fall back on the page's affiliation list:
+        one address per author in order, or all of them if the counts differ. Only
+        without a list is a surname-only match of the meta tags tried; None if that
+        fails too. """
+    soup = make_soup(html, {'name': ['meta', 'ol']}, backend)
+    index = AffiliationIndex(meta_pairs(soup))
+    found = index.resolve(names, loose=False)
+    if all(found):
+        return found
+    
+    affiliation_list = soup.find("ol", class_="affiliation-list")
+    if affiliation_list is None:
+        return [affiliation or index.lookup(name) for name, affiliation in zip(names, found)]
+    citation_authors = [x.text.strip() for x in affiliation_list.find_all('address')]
+    if len(citation_authors) != len(names):
+        citation_authors = [' '.join(citation_authors)] * len(names)
+    return [affiliation or listed for affiliation, listed in zip(found, citation_authors)]
+
+
+def standardise(bibtex):
+    """ Standardised Record from parse_ref's record. """
+    standard = Record(
+        Volume=int(bibtex['volume']),
+        Issue=bibtex['number'],
+        Title=bibtex['title'].strip(),
+        Journal='QJE',
+        DOI=bibtex['doi'],
+        Year=int(bibtex['year']),
+        Abstract=bibtex['abstract'].strip(),
+        JEL=[],
+        Authors=[]
+    )
+
+    # Publication date.
+    if bibtex['number'] == '1':
+        standard['PubDate'] = '{}-02-01'.format(bibtex['year'])
+    elif bibtex['number'] == '2':
+        standard['PubDate'] = '{}-05-01'.format(bibtex['year'])
+    elif bibtex['number'] == '3':
+        standard['PubDate'] = '{}-08-01'.format(bibtex['year'])
+    elif bibtex['number'] == '4':
+        standard['PubDate'] = '{}-11-01'.format(bibtex['year'])
+    elif bibtex['number'] == 'Supplement':
+        standard['PubDate'] = '{}-01-01'.format(bibtex['year'])
+
+    # Page numbers.
+    pages = bibtex['pages'].split('-')
+    standard['FirstPage'] = int(pages[0])
+    standard['LastPage'] = int(pages[1])
+    if standard['LastPage'] < standard['FirstPage']:
+        substr = len(str(standard['FirstPage'])) - len(str(standard['LastPage']))
+        standard['LastPage'] = int(str(standard['FirstPage'])[:substr] + str(standard['LastPage']))
+
+    # Find JEL classification codes.
+    jel_regex = re.compile(r'(.*) JEL Codes?: (.*)\.$')
+    jel_regex_match = jel_regex.search(bibtex['abstract'])
+    if jel_regex_match:
+        standard['Abstract'] = jel_regex_match.group(1).strip()
+        standard['JEL'] = [x.strip() for x in jel_regex_match.group(2).split(',')]
+
+    # Author
+    for author in bibtex['authors']:
+        standard['Authors'].append(Author(Name=author['name'], Affiliation=author.get('affiliation')))
+    
+    return standard
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from importlib.util import find_spec
+
+
+def _default_backend():
+    # lxml is several times faster than the pure-Python html.parser.
+    # Only look for it; it is imported by the first parse.
+    return 'lxml' if find_spec('lxml') else 'html.parser'
+
+
+# Parser used when none is given; set to 'html.parser' to force the standard library.
+BACKEND = _default_backend()
+
+
+def make_soup(markup, only=None, backend=None):
+    """ Parse HTML into a BeautifulSoup tree.
+        If only is given, build just the matching elements and their children
+        instead of the whole document. only is a SoupStrainer, a tag name, or a
+        dictionary of SoupStrainer arguments such as the constants below.
+        BeautifulSoup is imported on the first call, not with this module. """
+    from bs4 import BeautifulSoup, SoupStrainer
+    if isinstance(only, str):
+        only = SoupStrainer(only)
+    elif isinstance(only, dict):
+        only = SoupStrainer(**only)
+    return BeautifulSoup(markup, backend or BACKEND, parse_only=only)
+
+
+# Strainers for the elements each step actually reads, as SoupStrainer arguments.
+SAML_REQUEST = {'attrs': {'name': ['SAMLRequest', 'RelayState', 'EZproxyForm']}}
+SAML_RESPONSE = {'name': 'form'}
+EBSCO_PDF_URL = {'attrs': {'name': 'pdfUrl'}}
+WILEY_PDF_DOCUMENT = {'id': 'pdfDocument'}
+CITATION_META = {'name': 'meta'}
+OXFORD_SEARCH = {'name': ['a', 'link', 'input']}
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import getpass
+import sys
+import threading
+import time
+
+from .batch import imap_unordered
+from .exceptions import RavenError, SessionExpiredError
+
+
+LIVE = 'live'
+REFRESHING = 'refreshing'
+FAILED = 'failed'
+
+
+class SessionPool(object):
+    """ Pool of size independently authenticated connection objects of class cls.
+        Workers check a connection out, use it and check it back in; call does all three.
+        Each connection is lent to up to share workers at once, least busy first; its
+        requests.Session is thread-safe, so share > 1 lets many workers use few sessions.
+        When a connection's ezproxy session expires, it is re-authenticated on a
+        background thread while the call is retried on another connection.
+
+            >>> pool = SessionPool(JSTOR, size=8, login=deets)
+            >>> pdf = pool.call('pdf', doc_id)
+            >>> for result in pool.map('ref', doc_ids):
+            ...     print(result.id, result.value)
+            >>> pool.health()
+            {'live': 7, 'refreshing': 1, 'failed': 0}
+            >>> pool.close()
+    """
+    def __init__(self, cls, size=4, login={}, retries=2, share=1, **kwargs):
+
+        # Ask for the credentials once for all connections.
+        if 'userid' not in login:
+            login['userid'] = input('CRSid (userid): ')
+        if 'pwd' not in login:
+            login['pwd'] = getpass.getpass(stream=sys.stderr, prompt='Raven password (pwd): ')
+
+        self.size = size
+        self.retries = retries
+        self.share = share
+        self.state = {}
+        self._load = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+
+        # Authenticate every connection in parallel.
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            members = list(executor.map(lambda n: cls(login=dict(login), **kwargs), range(size)))
+        for conn in members:
+            self.state[conn] = LIVE
+            self._load[conn] = 0
+
+    def health(self):
+        """ Number of connections in each state. """
+        with self._lock:
+            states = list(self.state.values())
+        return {state: states.count(state) for state in (LIVE, REFRESHING, FAILED)}
+
+    def checkout(self, timeout=None):
+        """ Take the least busy live connection lent to fewer than share workers,
+            waiting for one if need be. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            while True:
+                if self._closed:
+                    raise RavenError('Pool is closed.')
+                free = [conn for conn, state in self.state.items() if state == LIVE and self._load[conn] < self.share]
+                if free:
+                    conn = min(free, key=self._load.get)
+                    self._load[conn] += 1
+                    return conn
+                if LIVE not in self.state.values() and REFRESHING not in self.state.values():
+                    raise RavenError('No live connections left in pool.')
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise RavenError('Timed out waiting for a connection.')
+                self._ready.wait(1)
+
+    def checkin(self, conn):
+        """ Return a connection to the pool. """
+        with self._ready:
+            self._load[conn] -= 1
+            self._ready.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """ Context manager checking a connection out and back in. """
+        conn = self.checkout(timeout)
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def refresh(self, conn):
+        """ Re-authenticate conn on a background thread; it rejoins the pool when done. """
+        with self._lock:
+            if self.state.get(conn) == REFRESHING:
+                return
+            self.state[conn] = REFRESHING
+
+        def run():
+            try:
+                conn.reauthenticate()
+            except Exception:
+                with self._ready:
+                    self.state[conn] = FAILED
+                    self._ready.notify_all()
+                return
+            with self._ready:
+                self.state[conn] = LIVE
+                self._ready.notify_all()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def call(self, method, *args, **kwargs):
+        """ Call method on a pooled connection, moving to another connection if the
+            session has expired. """
+        for attempt in range(self.retries + 1):
+            conn = self.checkout()
+            try:
+                result = getattr(conn, method)(*args, **kwargs)
+            except SessionExpiredError:
+                self.refresh(conn)
+                self.checkin(conn)
+                if attempt == self.retries:
+                    raise
+                continue
+            except Exception:
+                self.checkin(conn)
+                raise
+            self.checkin(conn)
+            return result
+
+    def map(self, method, ids, workers=None, **kwargs):
+        """ Call method for every id across the pool.
+            Yields a Result(id, value, error) per document in completion order. """
+        return imap_unordered(lambda id: self.call(method, id, **kwargs), ids, workers or self.size * self.share)
+
+    def close(self):
+        """ Close every connection's session; later checkouts raise RavenError. """
+        with self._ready:
+            self._closed = True
+            members = list(self.state)
+            self._ready.notify_all()
+        for conn in members:
+            conn.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,10 +1,58 @@
 # -*- coding: utf-8 -*-
 
-from bs4 import BeautifulSoup
-import requests
-import sys
-import traceback
-import getpass
+from .auth import RavenAuth, is_login_url
+from .batch import imap_unordered
+from .exceptions import SessionExpiredError
+from .schedule import PRIORITY, DEFAULT_PRIORITY
+from urllib.parse import urlparse
+from contextlib import contextmanager
+from functools import wraps
+import os
+import threading
+import time
+
+
+def operation(method):
+    """ Decorator for provider html, pdf and ref methods.
+        Records the method name as the thread's current operation while it runs, and
+        serves the result from the connection object's cache if it has one.
+        Streamed PDFs bypass the cache. If the connection has a catalogue, documents it
+        already has are skipped with AlreadyFetched and new results are entered in it;
+        only the outermost call is checked, so e.g. the html a ref needs for affiliations
+        is fetched even if that page was fetched before. """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, id, *args, **kwargs):
+        return run_operation(self, name, method, id, args, kwargs)
+
+    return wrapper
+
+
+def run_operation(conn, name, method, id, args, kwargs):
+    """ Return method(conn, id, *args, **kwargs) as the operation name; see operation.
+        For a method that does the work of conn.name(id, *args, **kwargs) differently,
+        e.g. reusing a page already downloaded. """
+    previous = getattr(conn._local, 'operation', None)
+    conn._local.operation = name
+    # The last response of each running operation, innermost last; see Raven.request.
+    responses = getattr(conn._local, 'responses', None)
+    if responses is None:
+        responses = conn._local.responses = []
+    responses.append(None)
+    try:
+        if conn.catalogue is not None and previous is None:
+            conn.catalogue.check(conn.identifier, name, id)
+        if conn.cache is None or kwargs.get('stream'):
+            value = method(conn, id, *args, **kwargs)
+        else:
+            value = conn.cache.call(conn, name, method, id, args, kwargs)
+        if conn.catalogue is not None and value:
+            conn.catalogue.add(type(conn).__name__, conn.identifier, name, id, value, kwargs.get('file'))
+        return value
+    finally:
+        conn._local.operation = previous
+        responses.pop()
 
 
 class Raven(object):
@@ -13,50 +61,197 @@ class Raven(object):
             2. complete the SAML handshake;
             3. access the destination URL.
         Requests Session object stored in session attribute for reuse.
+        If a SessionStore is supplied, a saved ezproxy session is reused when it is
+        still live and the handshake is only run when it has been rejected.
+        If a RavenAuth is supplied, its Raven login, session and connection pool are
+        shared with every other connection object built from it, and so is its
+        Transport; passing a different transport as well raises ValueError.
+        If a ResponseCache is supplied, html, pdf and ref results are served from it.
+        A Scheduler paces requests per host and backs off when a publisher throttles.
+        Metrics records latency, bytes and status of every request, and parse times.
+        A Transport sets connection pool size, timeouts, retries and keep-alive.
+        HTML is parsed with lxml when installed; pass parser='html.parser' to override.
+        If parse_pool is an Executor (e.g. a ProcessPoolExecutor), HTML, BibTeX and XML
+        parsing runs on it, so parsing can use several cores while threads fetch.
+        If a Catalogue is supplied, documents fetched before, by any provider sharing it,
+        are not fetched again.
+        A Hedge resends GETs that are slower than usual for their host and phase; a
+        CircuitBreaker fails requests to a host fast while it is down.
     """
-    def __init__(self, url, login={}):
-        
-        # Ask for username and password if not supplied.
-        if 'userid' not in login:
-            login['userid'] = input('CRSid (userid): ')
-        if 'pwd' not in login:
-            login['pwd'] = getpass.getpass(stream=sys.stderr, prompt='Raven password (pwd): ')
-        
-        # Input value to submit form.
-        login['submit'] = 'Login'
-        
-        # Start session and store in session attribute.
-        self.session = requests.Session()
-        
-        # Log into Raven.
-        raven_login = 'https://raven.cam.ac.uk/auth/authenticate2.html'
-        self.session.post(raven_login, data=login)
-        
-        # SAML request.
-        ezproxy = "http://ezproxy.lib.cam.ac.uk:2048/login"
-        request = self.session.get(ezproxy+'?url='+url)
-        soup = BeautifulSoup(request.text, 'html.parser')
-        saml = {
-            'SAMLRequest': soup.find(attrs={'name': 'SAMLRequest'})['value'],
-            'RelayState': soup.find(attrs={'name': 'RelayState'})['value'],
-            'url1': soup.find(attrs={'name': 'EZproxyForm'})['action']
-        }
+    # What document ids are: DOIs, or EBSCOhost's accession numbers.
+    identifier = 'doi'
+
+    def __init__(self, url, login={}, store=None, auth=None, cache=None, parser=None, transport=None, scheduler=None, metrics=None, parse_pool=None, catalogue=None, hedge=None, breaker=None):
+
+        # Private authentication context unless a shared one is supplied.
+        if auth is None:
+            auth = RavenAuth(login=login, store=store, transport=transport, metrics=metrics)
+        elif transport is not None and transport is not auth.transport:
+            raise ValueError('transport must be the shared RavenAuth\'s; pass it to RavenAuth instead')
+        self.auth = auth
+        self.transport = auth.transport
+
+        # Store session in session attribute; save destination URL.
+        self.session = auth.session
+        self.destination = url
+        self.url = auth.destination(url)
+
+        self.cache = cache
+        self.parser = parser
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.parse_pool = parse_pool
+        self.catalogue = catalogue
+        self.hedge = hedge
+        self.breaker = breaker
+        self._local = threading.local()
+
+    def request(self, method, url, phase='fetch', **kwargs):
+        """ Send a request with the session; every provider request goes through here.
+            Requests without an explicit timeout get the transport's and wait their
+            turn with the scheduler if there is one. Idempotent requests answered 429 or
+            503 are retried here, up to the transport's retries, each attempt waiting its
+            turn again, or backing off if there is no scheduler. phase names the step
+            for metrics.
+            GETs go through the hedge and every request through the circuit breaker,
+            if there are ones.
+            Raises SessionExpiredError if ezproxy sends the request back to the login pages,
+            and CircuitOpenError, without sending anything, if the host's circuit is open. """
+        kwargs.setdefault('timeout', self.transport.timeout)
+        kwargs.setdefault('hooks', {'response': self._check_login})
+        host = urlparse(url).netloc
+        if self.breaker is not None:
+            self.breaker.allow(host)
+        send = lambda: self.session.request(method, url, **kwargs)
+        if self.hedge is not None and method == 'GET':
+            send = lambda send=send: self.hedge.send((host, phase), send, self._paced(host, send, kwargs.get('stream')))
         
-        # SAML response.
-        response = self.session.post(saml['url1'], data=saml)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        start = time.perf_counter()
         try:
-            saml['SAMLResponse'] = soup.find(attrs={'name': 'SAMLResponse'})['value']
-            saml['url2'] = soup.find('form')['action']
-        except TypeError: # Username and password probably entered incorrectly.
-            traceback.print_exc(file=sys.stdout)
-            print("You're getting this error probably because your CRSid or password are incorrect.")
-            print("If this error persists, we have a problem so say something: github.com/erinhengel/raven-request.")
-            sys.exit(1)
+            operation = getattr(self._local, 'operation', None)
+            attempt = 0
+            while True:
+                if self.scheduler is not None:
+                    self.scheduler.acquire(host, PRIORITY.get(operation, DEFAULT_PRIORITY))
+                response = send()
+                if self.scheduler is not None:
+                    self.scheduler.feedback(host, response, body=not kwargs.get('stream'))
+                wait = self.transport.throttle_wait(method, response, attempt)
+                if wait is None:
+                    break
+                response.close()
+                attempt += 1
+                # With a scheduler, feedback has already slowed the host down.
+                if self.scheduler is None:
+                    time.sleep(wait)
+        except Exception as error:
+            if self.breaker is not None:
+                self.breaker.record(host, error=error)
+            raise
+        if self.breaker is not None:
+            self.breaker.record(host, response)
+        responses = getattr(self._local, 'responses', None)
+        if responses:
+            responses[-1] = response
         
-        # Complete SAML handshake.
-        post = self.session.post(saml['url2'], data=saml)
+        if self.metrics is not None:
+            nbytes = response.headers.get('Content-Length')
+            nbytes = int(nbytes) if nbytes and nbytes.isdigit() else 0
+            if not nbytes and not kwargs.get('stream'):
+                nbytes = len(response.content)
+            self.metrics.observe(type(self).__name__, getattr(self._local, 'operation', None), phase,
+                                 time.perf_counter() - start, nbytes, response.status_code)
+        return response
+
+    def _paced(self, host, send, stream=False):
+        # send, waiting for a scheduler token first and reporting the answer, if there is
+        # a scheduler; for the hedge's second copy, which request doesn't pace itself.
+        if self.scheduler is None:
+            return send
+        priority = PRIORITY.get(getattr(self._local, 'operation', None), DEFAULT_PRIORITY)
         
-        # Save destination URL.
-        self.url = post.url
-        
\ No newline at end of file
+        def paced():
+            self.scheduler.acquire(host, priority)
+            response = send()
+            self.scheduler.feedback(host, response, body=not stream)
+            return response
+        return paced
+
+    @contextmanager
+    def timed(self, phase='parse'):
+        """ Context manager recording how long its body takes under phase. """
+        if self.metrics is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.observe(type(self).__name__, getattr(self._local, 'operation', None), phase,
+                                 time.perf_counter() - start)
+
+    @staticmethod
+    def _check_login(response, *args, **kwargs):
+        # Runs on every hop, so an expired session is caught before following the redirect.
+        location = response.headers.get('Location', '')
+        if is_login_url(response.url) or (response.is_redirect and is_login_url(location)):
+            response.close()
+            raise SessionExpiredError(location or response.url)
+
+    def reauthenticate(self):
+        """ Run the Raven login and SAML handshake again after the session expired. """
+        self.auth.reset()
+        self.url = self.auth.destination(self.destination)
+
+    def unknown(self, ids, kind='ref'):
+        """ Those of ids the catalogue has no kind for; all of them without a catalogue. """
+        if self.catalogue is None:
+            return ids
+        return self.catalogue.unknown(self.identifier, kind, ids)
+
+    def catalogued(self, refs, key):
+        """ Enter each of refs in the catalogue, if there is one, under its key field
+            as it passes through. """
+        for ref in refs:
+            if self.catalogue is not None and ref and ref.get(key):
+                self.catalogue.add(type(self).__name__, self.identifier, 'ref', ref[key], ref)
+            yield ref
+
+    def parse(self, func, *args):
+        """ Return func(*args), run on the parse pool if there is one.
+            func is one of the module-level parse functions: it takes raw text or bytes
+            and returns plain data, so it can be sent to another process. """
+        with self.timed('parse'):
+            if self.parse_pool is None:
+                return func(*args)
+            return self.parse_pool.submit(func, *args).result()
+
+    def get(self, url, **kwargs):
+        """ Send a GET request; see request. """
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        """ Send a POST request; see request. """
+        return self.request('POST', url, data=data, **kwargs)
+
+    def html_many(self, ids, workers=4, **kwargs):
+        """ Download HTML of many documents on a pool of workers threads.
+            Yields a Result(id, value, error) per document in completion order. """
+        return imap_unordered(lambda id: self.html(id, **kwargs), ids, workers)
+
+    def pdf_many(self, ids, directory=None, workers=4, **kwargs):
+        """ Download PDFs of many documents on a pool of workers threads.
+            If directory supplied, save each PDF there named after its id.
+            Yields a Result(id, value, error) per document in completion order. """
+        def pdf(id):
+            if directory is None:
+                return self.pdf(id, **kwargs)
+            file = os.path.join(directory, str(id).replace('/', '_') + '.pdf')
+            return self.pdf(id, file=file, **kwargs)
+        return imap_unordered(pdf, ids, workers)
+
+    def ref_many(self, ids, workers=4, **kwargs):
+        """ Download bibliographic data of many documents on a pool of workers threads.
+            Yields a Result(id, value, error) per document in completion order. """
+        return imap_unordered(lambda id: self.ref(id, **kwargs), ids, workers)
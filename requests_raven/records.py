@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+""" Compact bibliographic records and bulk writers for them.
+
+    Record and Author keep their fields in __slots__ rather than a per-object
+    dictionary, but read like the dictionaries ref used to return: record['Title'],
+    record.get('Issue'), 'DOI' in record and dict(record) all work, and fields that
+    are None are left out. Every provider's bulk refs(standardised=True) yields Records;
+    ref(standardised=True) returns one document, as a plain dictionary (Record.as_dict),
+    so it can go straight to json.dumps like it always could.
+"""
+
+from collections.abc import Mapping
+import json
+import sqlite3
+
+
+class Slotted(Mapping):
+    """ Read-write mapping view of the __slots__ of a subclass. """
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError('unknown fields for {}: {}'.format(type(self).__name__, ', '.join(sorted(fields))))
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return (name for name in self.__slots__ if getattr(self, name) is not None)
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(k, v) for k, v in self.items()))
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class Author(Slotted):
+    """ Author of a Record. """
+    __slots__ = ('Name', 'Affiliation')
+
+
+class Record(Slotted):
+    """ Standardised bibliographic data of one document.
+            Title, Journal, Abstract, Issue, Publisher: text.
+            Volume, FirstPage, LastPage, Year: integers where the source has numbers.
+            PubDate: 'YYYY-MM-DD' when known.
+            ISSN, JEL, Keywords: lists of text.
+            Authors: list of Author.
+            DOI, AN (EBSCOhost accession number): identifiers.
+    """
+    __slots__ = (
+        'DOI', 'AN', 'Title', 'Authors', 'Journal', 'Volume', 'Issue', 'FirstPage', 'LastPage',
+        'Year', 'PubDate', 'ISSN', 'Publisher', 'Abstract', 'JEL', 'Keywords'
+    )
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Record from a dictionary with the same keys, e.g. one read back from JSON. """
+        data = dict(data)
+        if data.get('Authors') is not None:
+            data['Authors'] = [author if isinstance(author, Author) else Author(**author) for author in data['Authors']]
+        return cls(**data)
+
+    def as_dict(self):
+        """ Plain dictionary of the fields that are set, authors included. """
+        data = dict(self)
+        if 'Authors' in data:
+            data['Authors'] = [dict(author) for author in data['Authors']]
+        return data
+
+
+def jsonable(value):
+    """ json.dumps default= hook turning records and authors into dictionaries. """
+    if isinstance(value, Slotted):
+        return dict(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class Writer(object):
+    """ Base of the bulk writers: buffers items and hands them to flush in batches. """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self._pending = []
+
+    def write(self, record):
+        self._pending.append(self.encode(record))
+        if len(self._pending) >= self.buffer:
+            self.flush()
+
+    def write_many(self, records):
+        """ Write every record of an iterable, e.g. a generator of refs; return how many. """
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JSONLWriter(Writer):
+    """ Append records to a JSON lines file, one object per line.
+        Lines are buffered and written buffer records at a time.
+
+            >>> with JSONLWriter('refs.jsonl') as writer:
+            ...     writer.write_many(conn.refs(dois, standardised=True))
+    """
+    def __init__(self, path, buffer=1000):
+        Writer.__init__(self, buffer)
+        self.path = path
+        self._file = open(path, 'a', encoding='utf8')
+
+    def encode(self, record):
+        return json.dumps(record, default=jsonable, ensure_ascii=False) + '\n'
+
+    def flush(self):
+        self._file.writelines(self._pending)
+        self._file.flush()
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class SQLiteWriter(Writer):
+    """ Insert records into an SQLite table, batch rows per transaction.
+        One column per Record field; lists (Authors, ISSN, JEL, Keywords) are stored as
+        JSON. Rows are keyed by DOI, or AN if there is no DOI, and replaced if written
+        again.
+    """
+    LISTS = ('Authors', 'ISSN', 'JEL', 'Keywords')
+
+    def __init__(self, path, table='records', batch=500):
+        Writer.__init__(self, batch)
+        self.path = path
+        self.table = table
+        self._db = sqlite3.connect(path)
+        columns = ', '.join('"{}"'.format(name) for name in Record.__slots__)
+        self._db.execute('CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, {})'.format(table, columns))
+        self._insert = 'INSERT OR REPLACE INTO "{}" (id, {}) VALUES ({})'.format(
+            table, columns, ', '.join('?' * (len(Record.__slots__) + 1)))
+
+    def encode(self, record):
+        if not isinstance(record, Record):
+            record = Record.from_dict(record)
+        row = [record.DOI or record.AN]
+        for name in Record.__slots__:
+            value = getattr(record, name)
+            if name in self.LISTS and value is not None:
+                value = json.dumps(value, default=jsonable, ensure_ascii=False)
+            row.append(value)
+        return row
+
+    def flush(self):
+        with self._db:
+            self._db.executemany(self._insert, self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+def open_writer(path, **kwargs):
+    """ SQLiteWriter for .db, .sqlite and .sqlite3 paths, JSONLWriter otherwise. """
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SQLiteWriter(path, **kwargs)
+    return JSONLWriter(path, **kwargs)
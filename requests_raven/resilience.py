@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+""" Cutting tail latency: hedged GETs and a per-host circuit breaker.
+
+    Hedge sends a second copy of a GET that is slower than most recent requests to
+    the same host and phase, and uses whichever copy answers first. CircuitBreaker
+    stops sending requests to a host after repeated failures, so callers fail at
+    once instead of each waiting out a timeout, and lets one trial request through
+    once the host has had time to recover.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import math
+import threading
+import time
+
+from .exceptions import CircuitOpenError
+
+
+class Hedge(object):
+    """ Hedged GETs. A GET still unanswered after the percentile-th latency of the
+        last window requests to the same (host, phase) is sent again, and the first
+        response is used; the other is closed when it arrives. The delay is clamped
+        to [min_delay, max_delay], and nothing is hedged until min_samples latencies
+        have been seen. At most budget (a fraction) of requests are hedged, so a
+        slow host gets at most that much extra load.
+        phases, if given, limits hedging to those phases (e.g. search, pdfviewer).
+        The first copy of a hedged GET starts at once on a thread of its own, so the
+        caller can take whichever copy answers first; second copies run on a pool of
+        max_workers threads shared by every connection.
+
+            >>> hedge = Hedge(percentile=95)
+            >>> conn = OxfordQJE(login=deets, hedge=hedge)
+            >>> hedge.stats()
+            {'requests': 812, 'hedged': 37, 'won': 29}
+    """
+    def __init__(self, percentile=95, min_samples=20, min_delay=0.05, max_delay=10.0, window=200,
+                 budget=0.1, phases=None, max_workers=32):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.budget = budget
+        self.phases = frozenset(phases) if phases is not None else None
+        self.latencies = {}
+        self.counts = {'requests': 0, 'hedged': 0, 'won': 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def observe(self, key, seconds):
+        """ Record the latency of a request to key, a (host, phase) pair. """
+        with self._lock:
+            if key not in self.latencies:
+                self.latencies[key] = deque(maxlen=self.window)
+            self.latencies[key].append(seconds)
+
+    def delay(self, key):
+        """ Seconds to wait before hedging a request to key; None if it is not hedged. """
+        if self.phases is not None and key[1] not in self.phases:
+            return
+        with self._lock:
+            recent = self.latencies.get(key)
+            if recent is None or len(recent) < self.min_samples:
+                return
+            if self.counts['hedged'] >= self.budget * self.counts['requests']:
+                return
+            recent = sorted(recent)
+        rank = max(0, math.ceil(self.percentile / 100.0 * len(recent)) - 1)
+        return min(self.max_delay, max(self.min_delay, recent[rank]))
+
+    def _timed(self, key, send):
+        # Run send and record how long it took, for the percentile.
+        start = time.perf_counter()
+        response = send()
+        self.observe(key, time.perf_counter() - start)
+        return response
+
+    def send(self, key, send, again=None):
+        """ Return send(), calling again (send by default) if the first call is slow.
+            If one copy raises, the other's response is used; if both raise, the
+            first copy's error is raised. """
+        with self._lock:
+            self.counts['requests'] += 1
+        delay = self.delay(key)
+        if delay is None:
+            return self._timed(key, send)
+
+        first = _spawn(self._timed, key, send)
+        done, pending = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        with self._lock:
+            self.counts['hedged'] += 1
+        second = self._executor.submit(self._timed, key, again or send)
+        winner = None
+        pending = {first, second}
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+        if winner is None:
+            return first.result()
+
+        # Close the losing copy's response whenever it arrives.
+        for future in (first, second):
+            if future is not winner:
+                future.add_done_callback(_close)
+        if winner is second:
+            with self._lock:
+                self.counts['won'] += 1
+        return winner.result()
+
+    def stats(self):
+        """ Requests sent through the hedge, how many were hedged, and how many of
+            those the second copy won. """
+        with self._lock:
+            return dict(self.counts)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _spawn(func, *args):
+    # Run func on a new thread, not behind other requests in a pool; return its Future.
+    future = Future()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(func(*args))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _close(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class Circuit(object):
+    """ Breaker state of one host. """
+    __slots__ = ('state', 'failures', 'opened', 'reset', 'trial')
+
+    def __init__(self, reset):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0.0
+        self.reset = reset
+        self.trial = False
+
+
+class CircuitBreaker(object):
+    """ Per-host circuit breaker shared by connection objects.
+        After failures consecutive failed requests to a host (connection errors,
+        timeouts and statuses in statuses) its circuit opens: for reset seconds every
+        request to it raises CircuitOpenError without being sent. Then the circuit is
+        half-open and one trial request goes through; success closes the circuit,
+        failure opens it again for twice as long, up to max_reset seconds.
+        state, states and available let a scheduler or script route around a host
+        that is down.
+
+            >>> breaker = CircuitBreaker(failures=5, reset=30)
+            >>> conn = EBSCOhost(login=deets, breaker=breaker)
+            >>> breaker.states()
+            {'search-ebscohost-com.ezproxy.lib.cam.ac.uk': 'open'}
+    """
+    def __init__(self, failures=5, reset=30.0, max_reset=600.0, statuses=(500, 502, 503, 504)):
+        self.failures = failures
+        self.reset = reset
+        self.max_reset = max_reset
+        self.statuses = frozenset(statuses)
+        self.circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, host):
+        circuit = self.circuits.get(host)
+        if circuit is None:
+            circuit = self.circuits[host] = Circuit(self.reset)
+        return circuit
+
+    def _update(self, circuit, now):
+        # An open circuit becomes half-open once its reset time has passed.
+        if circuit.state == OPEN and now - circuit.opened >= circuit.reset:
+            circuit.state = HALF_OPEN
+            circuit.trial = False
+
+    def allow(self, host):
+        """ Raise CircuitOpenError unless a request to host may be sent now. """
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuit(host)
+            self._update(circuit, now)
+            if circuit.state == CLOSED:
+                return
+            if circuit.state == HALF_OPEN and not circuit.trial:
+                circuit.trial = True
+                return
+            retry = max(0.0, circuit.opened + circuit.reset - now)
+        raise CircuitOpenError(host, retry)
+
+    def failed(self, response=None, error=None):
+        """ True if the response or exception counts against the host. """
+        if error is not None:
+            # Only transport failures; a login redirect or bad page says nothing about the host.
+            from requests.exceptions import ConnectionError, Timeout
+            return isinstance(error, (ConnectionError, Timeout))
+        return response is not None and response.status_code in self.statuses
+
+    def record(self, host, response=None, error=None):
+        """ Update host's circuit with the outcome of a request allowed by allow. """
+        failed = self.failed(response, error)
+        if error is not None and not failed:
+            # Not the host's fault; give an unfinished trial back.
+            with self._lock:
+                self._circuit(host).trial = False
+            return
+        with self._lock:
+            circuit = self._circuit(host)
+            if not failed:
+                circuit.state = CLOSED
+                circuit.failures = 0
+                circuit.reset = self.reset
+                return
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN:
+                circuit.reset = min(self.max_reset, circuit.reset * 2)
+            if circuit.state == HALF_OPEN or circuit.failures >= self.failures:
+                circuit.state = OPEN
+                circuit.opened = time.monotonic()
+
+    def state(self, host):
+        """ closed, open or half-open. """
+        with self._lock:
+            circuit = self._circuit(host)
+            self._update(circuit, time.monotonic())
+            return circuit.state
+
+    def states(self):
+        """ State of every host seen so far. """
+        now = time.monotonic()
+        with self._lock:
+            for circuit in self.circuits.values():
+                self._update(circuit, now)
+            return {host: circuit.state for host, circuit in self.circuits.items()}
+
+    def available(self, host):
+        """ False while requests to host would fail fast. """
+        with self._lock:
+            circuit = self._circuit(host)
+            self._update(circuit, time.monotonic())
+            return circuit.state == CLOSED or (circuit.state == HALF_OPEN and not circuit.trial)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+""" Incremental parser for RIS-style tagged citation exports, as returned by
+    Wiley's plain text citation download. Lines are consumed one at a time and a
+    record is yielded as soon as it ends, so multi-record exports need not be held
+    in memory.
+"""
+
+import re
+
+
+# "AU  - Smith, John": two-character tag, two spaces, dash, value.
+LINE = re.compile(r'(?P<key>[A-Z][A-Z0-9])\s{2}-(?:\s(?P<value>.*))?$')
+
+
+def text_clean(string):
+    """ Strip whitespace and non-breaking spaces. """
+    return string.strip().replace(u'\xa0', u' ')
+
+
+def integer(string):
+    """ Integer if the value is a number, cleaned text otherwise (e.g. page e123). """
+    string = text_clean(string)
+    try:
+        return int(string)
+    except ValueError:
+        return string
+
+
+def author(string):
+    # Names are cleaned once affiliations have been matched against the raw value.
+    return {'Name': string}
+
+
+# Tag -> ((field, converter, repeated), ...). Repeated fields collect into lists.
+FIELDS = {
+    'AU': (('Authors', author, True),),
+    'TI': (('Title', text_clean, False),),
+    'JO': (('Journal', text_clean, False),),
+    'VL': (('Volume', integer, False),),
+    'IS': (('Issue', text_clean, False),),
+    'PB': (('Publisher', text_clean, False),),
+    'SP': (('FirstPage', integer, False),),
+    'EP': (('LastPage', integer, False),),
+    'KW': (('Keywords', text_clean, True),),
+    'PY': (('Year', text_clean, False), ('PubDate', integer, False)),
+    'AB': (('Abstract', text_clean, False),),
+    'DO': (('DOI', text_clean, False),),
+    'SN': (('ISSN', text_clean, False),),
+}
+
+# Tags marking the start and end of a record.
+START = 'TY'
+END = 'ER'
+
+
+def new_record():
+    """ Empty record with the repeated fields present. """
+    return {'Authors': [], 'Keywords': []}
+
+
+def parse(lines):
+    """ Yield one dictionary per record from an iterable of lines.
+        A record ends at an ER tag, at the next TY tag, or at the end of the input. """
+    record = new_record()
+    seen = False
+    last = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf8')
+        match = LINE.match(line)
+
+        # Untagged lines continue the previous text field (e.g. long abstracts).
+        if not match:
+            if last and line.strip() and isinstance(record.get(last), str):
+                record[last] = record[last] + ' ' + text_clean(line)
+            continue
+
+        key = match.group('key')
+        value = match.group('value') or ''
+        if key == START and seen:
+            yield record
+            record, seen = new_record(), False
+        if key == END:
+            if seen:
+                yield record
+            record, seen, last = new_record(), False, None
+            continue
+
+        last = None
+        for field, convert, repeated in FIELDS.get(key, ()):
+            if repeated:
+                record[field].append(convert(value))
+            else:
+                record[field] = convert(value)
+                last = field
+            seen = True
+
+    if seen:
+        yield record
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from email.utils import parsedate_to_datetime
+import heapq
+import itertools
+import re
+import threading
+import time
+
+
+# Lower numbers go first: small reference lookups jump ahead of large PDF transfers.
+PRIORITY = {'ref': 0, 'html': 1, 'pdf': 2}
+DEFAULT_PRIORITY = 1
+
+# Statuses and page text publishers use to say "slow down".
+THROTTLE_STATUS = (429, 503)
+INTERSTITIAL = re.compile(r'captcha|unusual traffic|are you a robot', re.IGNORECASE)
+
+
+def retry_after(response):
+    """ Seconds asked for by a Retry-After header, or None. """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return
+
+
+class TokenBucket(object):
+    """ Token bucket for one host whose rate adapts to the host's responses. """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = []
+        self.cond = threading.Condition()
+
+    def take(self):
+        """ Take a token; return 0 on success or the seconds until one is due. """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Scheduler(object):
+    """ Paces requests per destination host with adaptive token buckets.
+        Each host starts at rate requests per second with bursts of up to burst.
+        A throttling answer (429, 503 or a CAPTCHA-style interstitial) multiplies the
+        host's rate by backoff and honours any Retry-After; each normal answer adds
+        recover back, up to max_rate. Waiting requests are served by priority: ref
+        before html before pdf, first come first served within a priority.
+        One Scheduler can be shared by several connection objects.
+    """
+    def __init__(self, rate=2.0, burst=4, min_rate=0.05, max_rate=None, backoff=0.5, recover=0.05):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 4
+        self.backoff = backoff
+        self.recover = recover
+        self.buckets = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def bucket(self, host):
+        """ Token bucket of host, created on first use. """
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, host, priority=DEFAULT_PRIORITY):
+        """ Block until host may be sent another request. """
+        bucket = self.bucket(host)
+        ticket = (priority, next(self._seq))
+        with bucket.cond:
+            heapq.heappush(bucket.waiting, ticket)
+            while True:
+                if bucket.waiting[0] == ticket:
+                    wait = bucket.take()
+                    if not wait:
+                        heapq.heappop(bucket.waiting)
+                        bucket.cond.notify_all()
+                        return
+                    bucket.cond.wait(wait)
+                else:
+                    bucket.cond.wait()
+
+    def throttled(self, response, body=False):
+        """ True if response says the host wants us to slow down.
+            The body is only inspected if body is True, i.e. it has already been read. """
+        if response.status_code in THROTTLE_STATUS:
+            return True
+        if INTERSTITIAL.search(response.url):
+            return True
+        if body and 'html' in response.headers.get('Content-Type', ''):
+            return bool(INTERSTITIAL.search(response.text[:65536]))
+        return False
+
+    def feedback(self, host, response, body=False):
+        """ Adapt host's rate to its response. """
+        bucket = self.bucket(host)
+        with bucket.cond:
+            if self.throttled(response, body):
+                bucket.rate = max(self.min_rate, bucket.rate * self.backoff)
+                bucket.tokens = min(bucket.tokens, 0)
+                pause = retry_after(response)
+                if pause:
+                    bucket.paused_until = max(bucket.paused_until, time.monotonic() + pause)
+            else:
+                bucket.rate = min(self.max_rate, bucket.rate + self.recover)
+            bucket.cond.notify_all()
+
+    def rates(self):
+        """ Current rate of each host in requests per second. """
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class SessionStore(object):
+    """ On-disk store of authenticated ezproxy sessions.
+        One JSON file per (userid, destination) holds the cookie jar and the
+        resolved destination URL so a new Raven object can skip the SAML handshake.
+        Entries older than ttl seconds are ignored.
+    """
+    def __init__(self, path=None, ttl=3600):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.requests_raven', 'sessions')
+        self.path = path
+        self.ttl = ttl
+
+    def _file(self, userid, destination):
+        # File name is a hash so neither the CRSid nor the URL leak into the directory listing.
+        key = '{}\n{}'.format(userid, destination).encode('utf8')
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest() + '.json')
+
+    def load(self, userid, destination):
+        """ Return the saved session as a dictionary with url and cookies keys,
+            or None if nothing is saved or the entry has expired. """
+        try:
+            with open(self._file(userid, destination)) as fh:
+                entry = json.load(fh)
+        except (IOError, ValueError):
+            return
+        if time.time() - entry.get('saved', 0) > self.ttl:
+            self.discard(userid, destination)
+            return
+        return entry
+
+    def save(self, userid, destination, url, cookies):
+        """ Save destination URL and cookie jar of an authenticated session. """
+        entry = {
+            'url': url,
+            'saved': time.time(),
+            'cookies': [
+                {
+                    'name': c.name,
+                    'value': c.value,
+                    'domain': c.domain,
+                    'path': c.path,
+                    'secure': c.secure,
+                    'expires': c.expires,
+                    'rest': {'HttpOnly': None} if c.has_nonstandard_attr('HttpOnly') else {}
+                }
+                for c in cookies
+            ]
+        }
+
+        # Write atomically and readable only by the owner: these cookies are credentials.
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, mode=0o700)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(entry, fh)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self._file(userid, destination))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def discard(self, userid, destination):
+        """ Remove a saved session, e.g. after ezproxy has rejected it. """
+        try:
+            os.remove(self._file(userid, destination))
+        except OSError:
+            pass
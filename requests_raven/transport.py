@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+from itertools import takewhile
+from .schedule import THROTTLE_STATUS, retry_after
+import random
+import socket
+
+
+# Methods retried after errors; urllib3's default.
+IDEMPOTENT = Retry.DEFAULT_ALLOWED_METHODS
+
+class JitterRetry(Retry):
+    """ urllib3 Retry adding up to backoff_jitter seconds of random delay to each backoff,
+        so parallel workers retrying the same host don't retry in lockstep. """
+    BACKOFF_CAP = getattr(Retry, 'DEFAULT_BACKOFF_MAX', getattr(Retry, 'BACKOFF_MAX', 120))
+
+    def __init__(self, *args, **kwargs):
+        backoff_jitter = kwargs.pop('backoff_jitter', 0)
+        Retry.__init__(self, *args, **kwargs)
+        self.backoff_jitter = backoff_jitter
+
+    def new(self, **kwargs):
+        kwargs['backoff_jitter'] = self.backoff_jitter
+        return Retry.new(self, **kwargs)
+
+    def get_backoff_time(self):
+        # Exponential backoff over consecutive errors, as in urllib3, plus jitter.
+        consecutive = len(list(takewhile(lambda x: x.redirect_location is None, reversed(self.history))))
+        if consecutive <= 1:
+            return 0
+        backoff = self.backoff_factor * (2 ** (consecutive - 1))
+        if self.backoff_jitter:
+            backoff += random.uniform(0, self.backoff_jitter)
+        return min(self.BACKOFF_CAP, backoff)
+
+
+class TransportAdapter(HTTPAdapter):
+    """ HTTPAdapter that can turn on TCP keep-alive probes for long-lived pooled connections. """
+    def __init__(self, tcp_keepalive=False, **kwargs):
+        self.tcp_keepalive = tcp_keepalive
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+
+
+class Transport(object):
+    """ Connection pool, timeout, retry and keep-alive settings for a Raven session.
+            pool_connections: number of hosts to keep pools for.
+            pool_maxsize: connections kept per host; raise it to match the number of
+                worker threads talking to one ezproxy host.
+            pool_block: wait for a free connection instead of opening a throwaway one.
+            connect_timeout, read_timeout: seconds; applied to every request.
+            retries: retries of idempotent requests after connection errors and
+                retryable statuses, with exponential backoff_factor and up to
+                backoff_jitter seconds of random delay.
+            keep_alive: reuse connections; False sends Connection: close.
+            tcp_keepalive: enable TCP keep-alive probes on pooled sockets.
+        Throttling statuses (429, 503) in status_forcelist are retried by Raven.request
+        rather than by urllib3, so each attempt can wait for a Scheduler token; see
+        throttle_wait.
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 connect_timeout=10, read_timeout=60, retries=3, backoff_factor=0.5,
+                 backoff_jitter=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                 keep_alive=True, tcp_keepalive=False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.status_forcelist = status_forcelist
+        self.keep_alive = keep_alive
+        self.tcp_keepalive = tcp_keepalive
+
+    @property
+    def timeout(self):
+        """ (connect, read) timeout tuple for Requests. """
+        return (self.connect_timeout, self.read_timeout)
+
+    def retry(self):
+        """ Retry policy; only idempotent methods are retried.
+            Throttling statuses are left to throttle_wait. """
+        status_forcelist = tuple(status for status in self.status_forcelist if status not in THROTTLE_STATUS)
+        return JitterRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            status_forcelist=status_forcelist,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+
+    def throttle_wait(self, method, response, attempt):
+        """ Seconds to wait before sending again a request answered with a throttling
+            status on its attempt-th try (from 0); None if it isn't retried. Honours
+            Retry-After, otherwise backs off exponentially with jitter. """
+        status = response.status_code
+        if method not in IDEMPOTENT or attempt >= self.retries:
+            return
+        if status not in THROTTLE_STATUS or status not in self.status_forcelist:
+            return
+        wait = retry_after(response)
+        if wait is None:
+            wait = self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_jitter)
+        return min(JitterRetry.BACKOFF_CAP, wait)
+
+    def mount(self, session):
+        """ Apply these settings to a Requests Session. """
+        adapter = TransportAdapter(
+            tcp_keepalive=self.tcp_keepalive,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=self.retry()
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
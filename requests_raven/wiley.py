@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from requests_raven import Raven
-from bs4 import BeautifulSoup
-import re
+from requests_raven.raven import operation
+from requests_raven.download import stream_pdf
+from requests_raven.parsing import make_soup, WILEY_PDF_DOCUMENT, CITATION_META
+from requests_raven import ris
+from requests_raven.ris import text_clean
+from requests_raven.affiliations import AffiliationIndex, meta_pairs
+from requests_raven.records import Record
+from itertools import islice
 
 class Wiley(Raven):
     """ Create Raven connection to onlinelibrary.wiley.com.
@@ -11,26 +17,32 @@ class Wiley(Raven):
         Download bibliographic data of document.
     """
     
-    def __init__(self, login):
+    def __init__(self, login, **kwargs):
         # Establish a Raven connection object.
-        Raven.__init__(self, url='http://onlinelibrary.wiley.com', login=login)
+        Raven.__init__(self, url='http://onlinelibrary.wiley.com', login=login, **kwargs)
         
+    @operation
     def html(self, id):
         """ Download HTML of document's webpage. """
         url = '{}/doi/{}/abstract'.format(self.url, id)
-        request = self.session.get(url)
+        request = self.get(url, phase='page')
         return request.text
         
-    def pdf(self, id, file=None):
+    @operation
+    def pdf(self, id, file=None, stream=False):
         """ Download PDF of document.
-            If file supplied, save to local disk. """
+            If file supplied, save to local disk.
+            If stream, write straight to file and return Download(path, size, sha256). """
+        if stream and not file:
+            raise ValueError('stream requires file')
         
         # Get the webpage of the PDF; find the redirect URL in HTML to access PDF.
         pdf_url = '{}/doi/{}/pdf'.format(self.url, id)
-        request = self.session.get(pdf_url)
-        soup = BeautifulSoup(request.text, 'html.parser')
-        pdf_url = soup.find(attrs={'id': 'pdfDocument'}).attrs['src']
-        request = self.session.get(pdf_url)
+        request = self.get(pdf_url, phase='pdfframe')
+        pdf_url = self.parse(parse_pdf_frame, request.text, self.parser)
+        if stream:
+            return stream_pdf(self.get, pdf_url, file, phase='transfer')
+        request = self.get(pdf_url, phase='transfer')
         
         # Save locally if file specified.
         mypdf = request.content
@@ -40,112 +52,90 @@ class Wiley(Raven):
         
         return mypdf
         
-    def ref(self, id, affiliation=False):
+    @operation
+    def ref(self, id, affiliation=False, standardised=False):
         """ Download bibliographic data of document. 
-            If affiliation, find institutions affiliated with authors. """
-        
-        # Clean text, remove whitespace.
-        def text_clean(string):
-            return string.strip().replace(u'\xa0', u' ')
-        
-        # Find affiliation given an author's name.
-        def find_affiliation(next_element, n):
-            if next_element['name'] == 'citation_author_institution':
-                bibtex['Authors'][n]['Affiliation'] = text_clean(next_element['content'])
-                return True
-        
-        # Get bibliographic information using Wiley's export function.
-        ref_url = '{}/documentcitationdownloadformsubmit'.format(self.url)
-        payload = {
-            'fileFormat': 'PLAIN_TEXT',
-            'hasAbstract': 'CITATION_AND_ABSTRACT',
-            'doi': id
-        }
-        request = self.session.post(ref_url, data=payload)
-        raw_text = list(iter(request.text.splitlines()))
-        bibtex = {'Authors': [], 'Keywords': []}
-        for item in raw_text:
-            match = re.match('(?P<key>[A-Z]{2})\s{2}-\s(?P<value>.*)', item)
-            if match:
-                value = match.group('value')
-                key = match.group('key')
-                if key =='AU':
-                    bibtex['Authors'].append({'Name': value})
-                elif key == 'TI':
-                    bibtex['Title'] = text_clean(value)
-                elif key == 'JO':
-                    bibtex['Journal'] = text_clean(value)
-                elif key == 'VL':
-                    bibtex['Volume'] = int(text_clean(value))
-                elif key == 'IS':
-                    bibtex['Issue'] = text_clean(value)
-                elif key == 'PB':
-                    bibtex['Publisher'] = text_clean(value)
-                elif key == 'SP':
-                    bibtex['FirstPage'] = int(text_clean(value))
-                elif key == 'EP':
-                    bibtex['LastPage'] = int(text_clean(value))
-                elif key == 'KW':
-                    bibtex['Keywords'].append(text_clean(value))
-                elif key == 'PY':
-                    bibtex['Year'] = text_clean(value)
-                elif key == 'AB':
-                    bibtex['Abstract'] = text_clean(value)
-                elif key == 'DO':
-                    bibtex['DOI'] = text_clean(value)
-                elif key == 'SN':
-                    bibtex['ISSN'] = text_clean(value)
-                elif key == 'PY':
-                    bibtex['PubDate'] = int(text_clean(value))
-        
-        # If affiliation keyword is true, attempt to find each author's affiliation
-        # in the text of the HTML.
+            If affiliation, find institutions affiliated with authors.
+            None if the export has no record, so nothing is cached or catalogued. """
+        bibtex = next(self._export([id]), None)
+        if bibtex is None:
+            return
         if affiliation:
-            abstract_url = '{}/doi/{}/abstract'.format(self.url, id)
-            request = self.session.get(abstract_url)
-            soup = BeautifulSoup(request.text, 'html.parser')
-            
-            n = -1
-            citation_authors = soup.find_all(attrs={'name': 'citation_author'})
-            for author in bibtex['Authors']:
-                n += 1
-                found = False
-                
-                # Try to find an exact match.
-                for citation_author in citation_authors:
-                    if citation_author['content'] == author['Name']:
-                        found = find_affiliation(citation_author.next_element, n)
-                        break
-                if found: continue
-                
-                # Try to find match using author's last name.
-                nlist = author['Name'].split(', ')
-                for citation_author in citation_authors:
-                    citation_nlist = citation_author['content'].split(', ')
-                    if citation_nlist[0].strip() == nlist[0].strip():
-                        found = find_affiliation(citation_author.next_element, n)
-                        break
-                if found: continue
-                
-                # Try to find match using author's first name.
-                for citation_author in citation_authors:
-                    citation_nlist = citation_author['content'].split(', ')
-                    if citation_nlist[1].strip() == nlist[1].strip():
-                        found = find_affiliation(citation_author.next_element, n)
-                        break
-                if found: continue
-                
-                # Return None if no author found.
-                bibtex['Authors'][n]['Affiliation'] = None
-                
-            n = 0
-            for author in bibtex['Authors']:
-                bibtex['Authors'][n]['Name'] = text_clean(author['Name'])
-                n += 1
+            self._affiliation(id, bibtex)
         
         # If standardised, return a standardised set of bibliographic information;
         # otherwise, ref returns whatever is returned by Wiley's citation tool.
-        
-        # TO DO.
+        if standardised:
+            bibtex = standardise(bibtex).as_dict()
             
         return bibtex
+    
+    def refs(self, ids, affiliation=False, batch=50, standardised=False):
+        """ Download bibliographic data of many documents, batch DOIs per request.
+            Yields one record per document in the order Wiley returns them.
+            Documents already in the catalogue, if there is one, are left out. """
+        ids = iter(self.unknown(ids))
+        while True:
+            chunk = list(islice(ids, batch))
+            if not chunk:
+                return
+            for bibtex in self.catalogued(self._export(chunk), 'DOI'):
+                if affiliation and 'DOI' in bibtex:
+                    self._affiliation(bibtex['DOI'], bibtex)
+                yield standardise(bibtex) if standardised else bibtex
+    
+    def _export(self, ids):
+        # Get bibliographic information using Wiley's export function; parse as it streams in.
+        ref_url = '{}/documentcitationdownloadformsubmit'.format(self.url)
+        payload = {
+            'fileFormat': 'PLAIN_TEXT',
+            'hasAbstract': 'CITATION_AND_ABSTRACT',
+            'doi': ids
+        }
+        request = self.post(ref_url, data=payload, stream=True, phase='export')
+        request.encoding = request.encoding or 'utf-8'
+        try:
+            for bibtex in ris.parse(request.iter_lines(decode_unicode=True)):
+                yield bibtex
+        finally:
+            request.close()
+    
+    def _affiliation(self, id, bibtex):
+        # Attempt to find each author's affiliation in the text of the HTML.
+        abstract_url = '{}/doi/{}/abstract'.format(self.url, id)
+        request = self.get(abstract_url, phase='page')
+        names = [author['Name'] for author in bibtex['Authors']]
+        found = self.parse(parse_affiliations, request.text, names, self.parser)
+        for author, affiliation in zip(bibtex['Authors'], found):
+            author['Affiliation'] = affiliation
+            author['Name'] = text_clean(author['Name'])
+
+
+def standardise(bibtex):
+    """ Standardised Record from a parsed RIS record. """
+    standard = Record.from_dict(bibtex)
+    if standard.ISSN is not None:
+        standard.ISSN = [standard.ISSN]
+    
+    # PY is YYYY or YYYY/MM/DD/.
+    standard.PubDate = None
+    if standard.Year is not None:
+        date = [part for part in standard.Year.split('/') if part]
+        standard.Year = ris.integer(date[0]) if date else None
+        if len(date) == 3:
+            standard.PubDate = '{}-{}-{}'.format(*date)
+    return standard
+
+
+def parse_pdf_frame(html, backend=None):
+    """ URL of the PDF shown in the iframe of a Wiley PDF page. """
+    soup = make_soup(html, WILEY_PDF_DOCUMENT, backend)
+    return soup.find(attrs={'id': 'pdfDocument'}).attrs['src']
+
+
+def parse_affiliations(html, names, backend=None):
+    """ Affiliation of each of names from the citation_author meta tags of a Wiley
+        abstract page; None if not found. """
+    soup = make_soup(html, CITATION_META, backend)
+    found = AffiliationIndex(meta_pairs(soup)).resolve(names)
+    return [text_clean(affiliation) if affiliation else None for affiliation in found]
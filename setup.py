@@ -14,7 +14,9 @@ setup(
     author='Erin Hengel',
     url='http://www.erinhengel.com/software/requests-raven/',
     packages = ['requests_raven'],
-    install_requires=['requests>=2.9.1', 'beautifulsoup4>=4.4.1', 'bibtexparser>=0.6.1', 'xmltodict>=0.9.2'],
+    install_requires=['requests>=2.9.1', 'beautifulsoup4>=4.4.1', 'bibtexparser>=0.6.1'],
+    extras_require={'lxml': ['lxml']},
+    entry_points={'console_scripts': ['requests-raven = requests_raven.cli:main']},
     package_data={'': ['README.rst', 'LICENSE']},
     include_package_data=True,
     author_email='erin.hengel@gmail.com',
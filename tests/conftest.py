@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from requests_raven import RavenAuth
+from stubs import StubServer
+
+
+LOGIN = {'userid': 'test', 'pwd': 'test'}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """ Stub Raven, ezproxy and publishers, with RavenAuth pointed at them. """
+    server = StubServer(pdf_size=4096, page_size=1000).start()
+    monkeypatch.setattr(RavenAuth, 'raven_login', server.url + '/raven/login')
+    monkeypatch.setattr(RavenAuth, 'ezproxy', server.url + '/ezproxy/login')
+    yield server
+    server.stop()
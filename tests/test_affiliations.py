@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from requests_raven import jstor, oxford_qje
+from requests_raven.affiliations import AffiliationIndex
+from stubs import ABSTRACT_PAGE
+
+
+PAGE = ABSTRACT_PAGE.format(filler='')
+
+
+def test_affiliation_resolution_order():
+    index = AffiliationIndex([
+        ('Smith, John', 'Full name'),
+        ('Smith, Jane', 'Jane'),
+        ('J. Smith', 'Initials'),
+        ('Adam Smith', None),
+        ('Zoe Doe', 'Doe'),
+        ('Per Olsen', 'Olsen'),
+    ])
+    assert index.resolve([
+        'John Smith',     # full name, in either order
+        'Smith, J.',      # full name J. Smith
+        'Jo Smith',       # surname and initials: the first J. Smith listed
+        'A. Smith',       # only Adam Smith fits, and he has no affiliation
+        'Doe',            # surname alone, one author has it
+        'Per Nobody',     # given names alone never match
+        'Jan Olsen',      # surname alone, but the initials disagree
+    ]) == ['Full name', 'Initials', 'Full name', None, 'Doe', None, None]
+    assert index.lookup('Doe', loose=False) is None
+
+
+def test_jstor_co_authors_keep_their_own_affiliations():
+    found = jstor.parse_affiliations(PAGE, ['Per Krusell', 'Per Olsson', 'Jane Krusell', 'A. Smith'])
+    assert found == ['Stockholm University', None, None, 'Yale University']
+
+
+def test_jstor_name_inside_longer_text():
+    page = '<div class="authorInfo"><p>By Per Krusell, Professor</p>Stockholm University</div>'
+    assert jstor.parse_affiliations(page, ['Per Krusell']) == ['Stockholm University']
+
+
+def test_oxford_affiliation_list_before_loose_match():
+    found = oxford_qje.parse_affiliations(PAGE, ['Per Krusell', 'Per Smith'])
+    assert found == ['Stockholm University', 'Yale University']
+
+    page = PAGE.split('<ol')[0]
+    assert oxford_qje.parse_affiliations(page, ['Krusell', 'Per Smith']) == ['Stockholm University', None]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+from requests_raven import AsyncJSTOR, Transport
+from conftest import LOGIN
+
+
+def test_map_runs_limit_calls_at_once(stub):
+    async def harvest():
+        conn = await AsyncJSTOR.create(login=LOGIN, limit=8, transport=Transport(pool_maxsize=64))
+        stub.latency = 0.1
+        start = time.perf_counter()
+        results = [result async for result in conn.map('ref', ['10.1086/{}'.format(n) for n in range(64)], limit=64)]
+        elapsed = time.perf_counter() - start
+        conn.close()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(harvest())
+    assert len(results) == 64 and not any(result.error for result in results)
+    # 8 threads would need 0.8 s.
+    assert elapsed < 0.5
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from bench_providers import regressions
+
+
+REPORT = {
+    'provider': 'JSTOR', 'handshake_ms': 100.0,
+    'latency_ms': {'pdf': {'p50': 20.0}},
+    'throughput_docs_per_s': {'pdf': {'4': 200.0}},
+    'peak_memory_kb': {'stream': 200.0},
+}
+
+
+def report(**figures):
+    changed = dict(REPORT, **figures)
+    return {'results': [changed]}
+
+
+def test_within_tolerance_is_not_a_regression():
+    baseline = report()
+    assert regressions(report(handshake_ms=140.0)['results'], baseline, 0.5) == []
+    assert regressions(report(throughput_docs_per_s={'pdf': {'4': 120.0}})['results'], baseline, 0.5) == []
+
+
+def test_worse_figures_are_regressions():
+    baseline = report()
+    results = report(latency_ms={'pdf': {'p50': 40.0}}, throughput_docs_per_s={'pdf': {'4': 50.0}})['results']
+    assert regressions(results, baseline, 0.5) == [
+        ('JSTOR', 'latency_ms.pdf.p50', 20.0, 40.0),
+        ('JSTOR', 'throughput_docs_per_s.pdf.4', 200.0, 50.0),
+    ]
+    assert regressions(report(errors={'pdf': 1})['results'], baseline, 0.5) == [('JSTOR', 'errors', 0, {'pdf': 1})]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from requests_raven.bibtex import parse_fast, parse_bibtexparser, Unsupported
+from stubs import BIBTEX
+
+
+def test_bibtex_fast_path():
+    entry = parse_fast(BIBTEX.format(doi='10.1086/682574'))
+    assert entry['ID'] == entry['doi'] == '10.1086/682574'
+    assert entry['ENTRYTYPE'] == 'article'
+    assert entry['author'] == 'Per Krusell and Anthony A. Smith and Jane Doe'
+    assert (entry['volume'], entry['pages'], entry['issn']) == ('130', '1623-1672', '00335533, 15314650')
+
+
+@pytest.mark.parametrize('text', [
+    '@article{key, title = {Caf\\\'e}}',
+    '@string{jqe = "QJE"}',
+    '@article{key, journal = jqe}',
+    '@article{a, year = 1}\n@article{b, year = 2}',
+])
+def test_bibtex_fast_path_refuses_what_needs_bibtexparser(text):
+    with pytest.raises(Unsupported):
+        parse_fast(text)
+
+
+def test_bibtex_fast_path_agrees_with_bibtexparser():
+    pytest.importorskip('bibtexparser.bparser')
+    text = BIBTEX.format(doi='10.1086/682574')
+    assert parse_fast(text) == parse_bibtexparser(text)[0]
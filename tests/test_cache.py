@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from requests_raven import JSTOR, ResponseCache
+from conftest import LOGIN
+
+
+PAGE = '/stable/info/10.1086/682574'
+CITATION = '/citation/text/10.1086/682574'
+
+
+def test_miss_then_hit(stub, tmp_path):
+    conn = JSTOR(login=LOGIN, cache=ResponseCache(str(tmp_path)))
+    html = conn.html('10.1086/682574')
+    assert conn.html('10.1086/682574') == html
+    assert stub.requests[PAGE] == 1
+
+    # Different params are a different key.
+    conn.ref('10.1086/682574')
+    conn.ref('10.1086/682574', standardised=False)
+    assert stub.requests[CITATION] == 2
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=25)
+    cache.put('a', b'a' * 10)
+    cache.put('b', b'b' * 10)
+    cache.get('a')
+    cache.put('c', b'c' * 10)
+    assert cache.get('b') is None
+    assert cache.read(cache.get('a')) == b'a' * 10
+    assert cache.read(cache.get('c')) == b'c' * 10
+
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=25)
+    for key in 'abcd':
+        cache.put(key, b'x' * 10)
+    assert all(cache.get(key) for key in 'abcd')
+
+
+def test_concurrent_calls_fetch_once(stub, tmp_path):
+    stub.latency = 0.1
+    conn = JSTOR(login=LOGIN, cache=ResponseCache(str(tmp_path)))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(conn.html('10.1086/682574'))) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1 and results[0]
+    assert stub.requests[PAGE] == 1
+
+
+def test_hit_is_revalidated_with_etag(stub, tmp_path):
+    stub.etags = True
+    conn = JSTOR(login=LOGIN, cache=ResponseCache(str(tmp_path)))
+    html = conn.html('10.1086/682574')
+    assert conn.html('10.1086/682574') == html
+    # One full GET, then one conditional GET answered 304.
+    assert stub.requests[PAGE] == 2
+
+    # A changed page is fetched again.
+    stub.page_size *= 2
+    assert len(conn.html('10.1086/682574')) > len(html)
+    assert stub.requests[PAGE] == 4
+
+
+def test_validators_are_those_of_the_operation(stub, tmp_path):
+    stub.etags = True
+    conn = JSTOR(login=LOGIN, cache=ResponseCache(str(tmp_path)))
+    conn.html('10.1086/682574')
+
+    # The ref's html comes from the cache; its validators are the citation's, not the page's.
+    ref = conn.ref('10.1086/682574', affiliation=True)
+    assert conn.ref('10.1086/682574', affiliation=True) == ref
+    assert stub.requests[CITATION] == 2
+    assert stub.requests[PAGE] == 2
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from requests_raven import JSTOR, EBSCOhost, OxfordQJE, Wiley, Catalogue, AlreadyFetched
+from conftest import LOGIN
+
+
+def test_ebscohost_ref_links_accession_number_to_doi(stub, tmp_path):
+    catalogue = Catalogue(str(tmp_path / 'catalogue.sqlite'))
+    ebsco = EBSCOhost(login=LOGIN, catalogue=catalogue)
+    jstor = JSTOR(login=LOGIN, catalogue=catalogue)
+
+    ref = ebsco.ref('100001', standardised=True)
+    assert ref['DOI'] == '10.1086/100001'
+    assert catalogue.find('an', 'ref', '100001')['doi'] == '10.1086/100001'
+
+    # Fetched from JSTOR by DOI, so skipped on EBSCOhost by accession number.
+    jstor.pdf('10.1086/100001')
+    with pytest.raises(AlreadyFetched) as error:
+        ebsco.pdf('100001')
+    assert error.value.entry['provider'] == 'JSTOR'
+
+
+def test_nested_html_is_not_skipped(stub, tmp_path):
+    catalogue = Catalogue(str(tmp_path / 'catalogue.sqlite'))
+    jstor = JSTOR(login=LOGIN, catalogue=catalogue)
+    oxford = OxfordQJE(login=LOGIN, catalogue=catalogue)
+
+    jstor.html('10.1086/682574')
+    assert jstor.ref('10.1086/682574', affiliation=True)['DOI'] == '10.1086/682574'
+    assert stub.requests['/stable/info/10.1086/682574'] == 2
+
+    oxford.html('10.1093/qje/qjv022')
+    fetched = oxford.fetch('10.1093/qje/qjv022', html=False, pdf=False, ref=True, affiliation=True)
+    assert fetched['ref']['authors'][0]['affiliation'] == 'Stockholm University'
+    with pytest.raises(AlreadyFetched):
+        jstor.html('10.1086/682574')
+
+
+def test_empty_export_is_not_catalogued(stub, tmp_path):
+    catalogue = Catalogue(str(tmp_path / 'catalogue.sqlite'))
+    wiley = Wiley(login=LOGIN, catalogue=catalogue)
+    stub.broken.add('/documentcitationdownloadformsubmit')
+    assert wiley.ref('10.3982/ECTA11000') is None
+
+    stub.broken.clear()
+    assert wiley.ref('10.3982/ECTA11000')['DOI'] == '10.3982/ECTA11000'
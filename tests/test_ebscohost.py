@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from xml.etree.ElementTree import fromstring
+
+import pytest
+
+from requests_raven import EBSCOhost, RavenError, SessionExpiredError
+from requests_raven.download import NOT_FOUND
+from requests_raven.ebscohost import element_dict, record, standardise
+from conftest import LOGIN
+from stubs import EBSCO_REC, EBSCO_BARE
+
+
+def test_export_error_page_raises(stub):
+    conn = EBSCOhost(login=LOGIN)
+    stub.broken.add('/ehost/delivery/ExportPanelSave/')
+    with pytest.raises(SessionExpiredError):
+        conn.ref('100001')
+    with pytest.raises(SessionExpiredError):
+        list(conn.refs(['100001', '100002']))
+
+
+def test_pdf_without_pdf_url_or_session_parameters(stub):
+    conn = EBSCOhost(login=LOGIN)
+    stub.broken.add('/ehost/pdfviewer/')
+    outcome = conn.pdf('100001')
+    assert not outcome
+    assert outcome.status == NOT_FOUND
+
+    # A landing page URL without sid, vid and hid.
+    conn._tokens = lambda url: None
+    with pytest.raises(RavenError):
+        conn.pdf('100002')
+
+
+def test_element_dict_like_xmltodict():
+    element = fromstring('<a x="1"><b>one</b><b>two</b><c y="2">text</c><d/></a>')
+    assert element_dict(element) == {
+        '@x': '1', 'b': ['one', 'two'], 'c': {'@y': '2', '#text': 'text'}, 'd': None
+    }
+
+
+def test_ebscohost_single_author():
+    rec = EBSCO_REC.format(an='100001').replace(
+        '<au>Krusell, Per</au><au>Smith, Anthony A.</au><affil>Stockholm</affil><affil>Yale</affil>',
+        '<au>Krusell, Per</au><affil>Stockholm</affil>')
+    bibtex = record(element_dict(fromstring(rec).find('header')))
+    assert bibtex['authors'] == [{'name': 'Krusell, Per', 'affiliation': 'Stockholm'}]
+    assert bibtex['doi'] == '10.1086/100001'
+    assert bibtex['subject'] == ['Economics', 'Health']
+
+    standard = standardise(bibtex)
+    assert (standard.FirstPage, standard.LastPage, standard.PubDate) == (1623, 1672, '2015-11-01')
+    assert dict(standard.Authors[0]) == {'Name': 'Krusell, Per', 'Affiliation': 'Stockholm'}
+
+
+def test_ebscohost_authors_and_affiliations():
+    bibtex = record(element_dict(fromstring(EBSCO_REC.format(an='100001')).find('header')))
+    assert bibtex['authors'] == [
+        {'name': 'Krusell, Per', 'affiliation': 'Stockholm'},
+        {'name': 'Smith, Anthony A.', 'affiliation': 'Yale'},
+    ]
+
+
+def test_record_without_optional_elements():
+    bibtex = record(element_dict(fromstring(EBSCO_BARE.format(an='bare1')).find('header')))
+    assert bibtex['AN'] == 'bare1'
+    assert (bibtex['abstract'], bibtex['subject'], bibtex['authors'], bibtex['url']) == (None, [], [], None)
+    assert standardise(bibtex).as_dict() == {'AN': 'bare1', 'ISSN': [], 'Keywords': [], 'Authors': []}
+
+
+def test_refs_skip_malformed_records_and_continue(stub):
+    conn = EBSCOhost(login=LOGIN)
+    refs = list(conn.refs(['100001', 'empty1', 'bare1', '100002', '100003'], batch=2))
+    assert [ref['AN'] for ref in refs] == ['100001', 'bare1', '100002', '100003']
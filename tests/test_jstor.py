@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+from requests_raven import JSTOR, Transport
+from requests_raven.download import UNAVAILABLE
+from conftest import LOGIN
+
+
+def test_pdf_accepts_terms_again_after_reauthenticate(stub):
+    conn = JSTOR(login=LOGIN)
+    assert conn.pdf('10.1086/682574').startswith(b'%PDF')
+    assert conn.terms_accepted
+
+    conn.reauthenticate()
+    assert not conn.terms_accepted
+    assert conn.pdf('10.1086/682574').startswith(b'%PDF')
+
+
+def test_pdf_error_status_is_not_reported_as_not_entitled(stub):
+    conn = JSTOR(login=LOGIN, transport=Transport(retries=0))
+    assert conn.pdf('10.1086/682574')
+
+    stub.throttle = 1
+    outcome = conn.pdf('10.1086/682575')
+    assert not outcome
+    assert (outcome.status, outcome.http_status) == (UNAVAILABLE, 429)
+
+
+def test_pdf_resumes_partial_download(stub, tmp_path):
+    conn = JSTOR(login=LOGIN)
+    file = str(tmp_path / 'article.pdf')
+
+    # The stub's PDF is '%PDF-1.4\n' and zeros; the X shows the part was kept and appended to.
+    with open(file + '.part', 'wb') as fh:
+        fh.write(b'%PDF-1.4\nX' + b'0' * 990)
+    result = conn.pdf('10.1086/682574', file=file, stream=True)
+    with open(file, 'rb') as fh:
+        body = fh.read()
+    assert body == b'%PDF-1.4\nX' + stub.pdf[10:]
+    assert result.size == len(stub.pdf) == 4096
+    assert result.sha256 == hashlib.sha256(body).hexdigest()
+
+
+def test_pdf_resume_of_finished_download_completes_it(stub, tmp_path):
+    conn = JSTOR(login=LOGIN)
+    file = str(tmp_path / 'article.pdf')
+    conn.pdf('10.1086/682575')
+
+    # Range past the end: answered 416, and the part is already the whole PDF.
+    with open(file + '.part', 'wb') as fh:
+        fh.write(stub.pdf)
+    result = conn.pdf('10.1086/682574', file=file, stream=True)
+    assert result.size == len(stub.pdf)
+    assert result.sha256 == hashlib.sha256(stub.pdf).hexdigest()
+    assert not os.path.exists(file + '.part')
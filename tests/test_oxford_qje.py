@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from requests_raven import OxfordQJE, NotPDFError, Metrics, Catalogue
+from requests_raven.oxford_qje import parse_search
+from conftest import LOGIN
+
+
+def test_pdf_error_page_raises(stub):
+    conn = OxfordQJE(login=LOGIN)
+    stub.broken.add('/content/130/4/1623.full.pdf')
+    with pytest.raises(NotPDFError):
+        conn.pdf('10.1093/qje/qjv022')
+
+
+def test_fetch_ref_is_an_operation(stub, tmp_path):
+    metrics = Metrics()
+    catalogue = Catalogue(str(tmp_path / 'catalogue.sqlite'))
+    conn = OxfordQJE(login=LOGIN, metrics=metrics, catalogue=catalogue)
+
+    fetched = conn.fetch('10.1093/qje/qjv022', pdf=False, affiliation=True)
+    assert fetched['ref']['authors'][0]['affiliation'] == 'Stockholm University'
+    assert catalogue.find('doi', 'ref', '10.1093/qje/qjv022')['provider'] == 'OxfordQJE'
+    assert ('OxfordQJE', 'ref', 'export') in metrics.series
+    # The abstract page was downloaded once, for both the html and the affiliations.
+    assert stub.requests['/content/130/4/1623.abstract'] == 1
+
+
+@pytest.mark.parametrize('backend', ['lxml', 'html.parser'])
+def test_parse_search_reads_only_the_links(backend):
+    html = ('<html><body><p>Results</p><div class="cit-extra"><a rel="abstract" href="http://qje/content/130/4/1623.abstract">'
+            'Abstract</a><a rel="full-text.pdf" href="http://qje/content/130/4/1623.full.pdf+html">PDF</a></div>'
+            '<form><input name="gca" value="qje;130/4/1623"></form></body></html>')
+    assert parse_search(html, 'http://qje', backend) == {
+        'html': 'http://qje/content/130/4/1623.abstract',
+        'pdf': 'http://qje/content/130/4/1623.full.pdf',
+        'gca': 'qje;130/4/1623',
+    }
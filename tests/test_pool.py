@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from requests_raven import JSTOR, SessionPool, RavenError, SessionExpiredError
+from conftest import LOGIN
+
+
+def test_connections_are_shared_up_to_share(stub):
+    pool = SessionPool(JSTOR, size=2, share=2, login=dict(LOGIN))
+    first, second = pool.checkout(), pool.checkout()
+    assert first is not second
+    # Least busy first, then each lent to a second worker.
+    assert {pool.checkout(), pool.checkout()} == {first, second}
+    with pytest.raises(RavenError):
+        pool.checkout(timeout=0.1)
+
+    pool.checkin(second)
+    assert pool.checkout() is second
+    pool.close()
+
+
+def test_workers_reuse_pooled_connections(stub, monkeypatch):
+    stub.latency = 0.05
+    pool = SessionPool(JSTOR, size=2, share=2, login=dict(LOGIN))
+    used = []
+    lock = threading.Lock()
+    ref = JSTOR.ref
+
+    def counting_ref(conn, *args, **kwargs):
+        with lock:
+            used.append(conn)
+        return ref(conn, *args, **kwargs)
+
+    monkeypatch.setattr(JSTOR, 'ref', counting_ref)
+    results = list(pool.map('ref', ['10.1086/{}'.format(682574 + n) for n in range(12)], workers=4))
+    assert all(result.value for result in results)
+    assert len(used) == 12 and len(set(used)) == 2
+    # Only the two sessions were ever authenticated.
+    assert stub.requests['/ezproxy/acs'] == 2
+    pool.close()
+
+
+def test_close(stub):
+    with SessionPool(JSTOR, size=2, login=dict(LOGIN)) as pool:
+        conn = pool.checkout()
+        pool.checkin(conn)
+    with pytest.raises(RavenError):
+        pool.checkout()
+    assert not conn.session.adapters['http://'].poolmanager.pools
+
+
+def test_expired_session_is_detected(stub):
+    conn = JSTOR(login=LOGIN)
+    stub.expire_after = 0
+    with pytest.raises(SessionExpiredError):
+        conn.html('10.1086/682574')
+
+    conn.reauthenticate()
+    assert 'authorInfo' in conn.html('10.1086/682574')
+
+
+def test_expired_session_is_reauthenticated_once_and_retried(stub):
+    pool = SessionPool(JSTOR, size=1, login=dict(LOGIN))
+    ids = ['10.1086/{}'.format(682574 + n) for n in range(8)]
+
+    stub.expire_after = 3
+    results = list(pool.map('ref', ids, workers=1))
+
+    assert sorted(result.value['DOI'] for result in results) == ids
+    assert stub.requests['/ezproxy/acs'] == 2
+    # Eight references, plus the one that met the login page sent again.
+    assert sum(count for path, count in stub.requests.items() if path.startswith('/citation/text/')) == 9
+    assert pool.health() == {'live': 1, 'refreshing': 0, 'failed': 0}
+    pool.close()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from requests_raven import JSTOR, EBSCOhost, OxfordQJE, Wiley, cli
+from conftest import LOGIN
+
+
+PROVIDERS = [
+    ('jstor', JSTOR, '10.1086/682574'),
+    ('wiley', Wiley, '10.3982/ECTA11000'),
+    ('ebscohost', EBSCOhost, '100001'),
+    ('oxford_qje', OxfordQJE, '10.1093/qje/qjv022'),
+]
+
+
+@pytest.mark.parametrize('name, cls, id', PROVIDERS)
+def test_standardised_ref_is_json(stub, name, cls, id):
+    ref = cls(login=LOGIN).ref(id, standardised=True)
+    assert type(ref) is dict
+    assert json.loads(json.dumps(ref)) == ref
+    assert ref['Authors'] and 'Name' in ref['Authors'][0]
+
+
+@pytest.mark.parametrize('name, cls, id', PROVIDERS)
+def test_standardised_ref_through_cli(stub, tmp_path, monkeypatch, name, cls, id):
+    ids = tmp_path / 'ids.txt'
+    ids.write_text(id)
+    monkeypatch.setenv('RAVEN_PASSWORD', LOGIN['pwd'])
+
+    status = cli.main([name, str(ids), '--out', str(tmp_path / 'out'), '--what', 'ref',
+                       '--standardised', '--userid', LOGIN['userid']])
+
+    assert status == 0
+    with open(str(tmp_path / 'out' / 'manifest.jsonl')) as fh:
+        entry, = [json.loads(line) for line in fh]
+    with open(entry['path'], encoding='utf8') as fh:
+        assert json.load(fh) == cls(login=LOGIN).ref(id, standardised=True)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import time
+from urllib.parse import urlparse
+
+import pytest
+
+from requests_raven import JSTOR, CircuitBreaker, CircuitOpenError, Hedge, Scheduler, Transport
+from requests_raven.download import UNAVAILABLE
+from requests_raven.resilience import CLOSED, HALF_OPEN, OPEN
+from conftest import LOGIN
+
+
+def test_hedged_gets_are_not_capped_by_the_pool(stub):
+    hedge = Hedge(min_samples=1, max_workers=2)
+    conn = JSTOR(login=LOGIN, hedge=hedge, transport=Transport(pool_maxsize=40))
+    hedge.observe((urlparse(conn.url).netloc, 'page'), 5.0)
+
+    stub.latency = 0.1
+    start = time.perf_counter()
+    results = list(conn.html_many(['10.1086/{}'.format(n) for n in range(40)], workers=40))
+    assert not any(result.error for result in results)
+    # 40 GETs through 2 pooled threads would take 2 s.
+    assert time.perf_counter() - start < 1.0
+    assert hedge.stats()['hedged'] == 0
+
+
+def test_second_copy_takes_a_scheduler_token(stub):
+    scheduler = Scheduler(rate=50, burst=10)
+    acquired = []
+    acquire = scheduler.acquire
+    scheduler.acquire = lambda host, priority=1: acquired.append(host) or acquire(host, priority)
+    hedge = Hedge(min_samples=1, budget=1.0, min_delay=0.05)
+    conn = JSTOR(login=LOGIN, hedge=hedge, scheduler=scheduler)
+    hedge.observe((urlparse(conn.url).netloc, 'page'), 0.01)
+
+    stub.latency = 0.2
+    conn.html('10.1086/682574')
+    assert hedge.stats()['hedged'] == 1
+    assert len(acquired) == 2
+
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def fail(breaker, host, times):
+    for n in range(times):
+        breaker.allow(host)
+        breaker.record(host, Response(503))
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, reset=30)
+    fail(breaker, 'a', 2)
+    breaker.allow('a')
+    breaker.record('a', Response(200))
+    fail(breaker, 'a', 2)
+    assert breaker.state('a') == CLOSED
+
+    fail(breaker, 'a', 1)
+    assert breaker.state('a') == OPEN
+    assert not breaker.available('a')
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.allow('a')
+    assert 29 < error.value.retry_after <= 30
+    # Other hosts are unaffected.
+    breaker.allow('b')
+    assert breaker.states() == {'a': OPEN, 'b': CLOSED}
+
+
+def test_circuit_half_opens_after_cooldown_and_closes_on_success():
+    breaker = CircuitBreaker(failures=1, reset=0.1)
+    fail(breaker, 'a', 1)
+    assert breaker.state('a') == OPEN
+    time.sleep(0.15)
+    assert breaker.state('a') == HALF_OPEN
+
+    # One trial request at a time.
+    breaker.allow('a')
+    with pytest.raises(CircuitOpenError):
+        breaker.allow('a')
+    breaker.record('a', Response(200))
+    assert breaker.state('a') == CLOSED
+    breaker.allow('a')
+
+
+def test_failed_trial_reopens_for_longer():
+    breaker = CircuitBreaker(failures=1, reset=0.2, max_reset=0.4)
+    fail(breaker, 'a', 1)
+    time.sleep(0.25)
+    fail(breaker, 'a', 1)
+    assert breaker.state('a') == OPEN
+    time.sleep(0.3)
+    assert breaker.state('a') == OPEN
+    time.sleep(0.15)
+    assert breaker.state('a') == HALF_OPEN
+
+
+def test_breaker_fails_requests_fast(stub):
+    breaker = CircuitBreaker(failures=2, reset=30, statuses=(429,))
+    conn = JSTOR(login=LOGIN, breaker=breaker, transport=Transport(retries=0))
+    conn.pdf('10.1086/682574')
+
+    stub.throttle = 2
+    assert conn.pdf('10.1086/682575').status == UNAVAILABLE
+    assert conn.pdf('10.1086/682576').status == UNAVAILABLE
+    with pytest.raises(CircuitOpenError):
+        conn.pdf('10.1086/682577')
+    assert '/stable/pdfplus/10.1086/682577.pdf' not in stub.requests
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+from requests_raven import ris
+from stubs import RIS
+
+
+def test_ris_multiple_records_with_continuation_lines():
+    text = RIS.format(doi='10.3982/ECTA1') + RIS.format(doi='10.3982/ECTA2').replace(
+        'AB  - An abstract.', 'AB  - An abstract\n  that goes on.')
+    first, second = ris.parse(text.splitlines())
+    assert first['DOI'] == '10.3982/ECTA1'
+    assert first['Abstract'] == 'An abstract.'
+    assert second['Abstract'] == 'An abstract that goes on.'
+    assert [author['Name'] for author in second['Authors']] == ['Krusell, Per', 'Smith, Anthony A.']
+    assert (second['Volume'], second['FirstPage'], second['LastPage'], second['ISSN']) == (83, 1623, 1672, '1468-0262')
+
+
+def test_ris_record_ends_at_next_type_tag_or_end_of_input():
+    lines = ['TY  - JOUR', 'TI  - One', 'TY  - JOUR', 'TI  - Two', 'SP  - e123']
+    assert [(r['Title'], r.get('FirstPage')) for r in ris.parse(lines)] == [('One', None), ('Two', 'e123')]
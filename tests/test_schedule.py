@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from requests_raven import JSTOR, Wiley, RavenAuth, Scheduler, Transport
+from conftest import LOGIN
+
+
+def test_throttled_retries_go_through_scheduler(stub):
+    scheduler = Scheduler(rate=50, burst=10)
+    acquired = []
+    acquire = scheduler.acquire
+    scheduler.acquire = lambda host, priority=1: acquired.append(host) or acquire(host, priority)
+    conn = JSTOR(login=LOGIN, scheduler=scheduler)
+
+    stub.throttle = 2
+    assert 'authorInfo' in conn.html('10.1086/682574')
+    assert stub.requests['/stable/info/10.1086/682574'] == 3
+    assert len(acquired) == 3
+    assert list(scheduler.rates().values())[0] < 50
+
+
+def test_scheduler_leaves_shared_session_alone(stub):
+    auth = RavenAuth(login=dict(LOGIN), transport=Transport(backoff_factor=0.01, backoff_jitter=0))
+    jstor = JSTOR(login=LOGIN, auth=auth)
+    adapter = auth.session.get_adapter(jstor.url)
+    Wiley(login=LOGIN, auth=auth, scheduler=Scheduler(rate=50))
+    assert auth.session.get_adapter(jstor.url) is adapter
+
+    # Without a scheduler, throttled requests are still retried, after a backoff.
+    stub.throttle = 2
+    assert 'authorInfo' in jstor.html('10.1086/682574')
+    assert stub.requests['/stable/info/10.1086/682574'] == 3
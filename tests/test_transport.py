@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from requests_raven import JSTOR, RavenAuth, Transport
+from conftest import LOGIN
+
+
+def test_shared_auth_supplies_the_transport(stub):
+    transport = Transport(read_timeout=5)
+    auth = RavenAuth(login=dict(LOGIN), transport=transport)
+
+    assert JSTOR(login=LOGIN, auth=auth).transport is transport
+    assert JSTOR(login=LOGIN, auth=auth, transport=transport).transport is transport
+    with pytest.raises(ValueError):
+        JSTOR(login=LOGIN, auth=auth, transport=Transport(read_timeout=60))